@@ -1,10 +1,10 @@
-import json
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from matplotlib.ticker import FuncFormatter
 from enum import Enum
 import os
+from ingestao.agregacao import Consulta, agregar_arquivos
 
 directory = 'dados/'
 
@@ -30,42 +30,23 @@ def format_legend_label(label, max_line_length=50):
     else:
         return label
 
+def pagamento(tipo_movimento):
+    return 'pagamento' in tipo_movimento.lower()
+
+def agregar_pagamentos(tipo_de_despesa: TiposDeDespesa, **consulta):
+    return agregar_arquivos(directory, tipo_de_despesa.value, Consulta(tipos_movimento=pagamento, **consulta))
+
+def dimensao_de(tipo_de_despesa: TiposDeDespesa):
+    return 'naturezaDespesa.detalhamento' if tipo_de_despesa == TiposDeDespesa.DESPESA else 'naturezaDespesa.elemento'
+
 def despesa_por_mes_do_ano(user_year: int, user_month: int, tipo_de_despesa: TiposDeDespesa):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and tipo_de_despesa.value in filename.lower()]
-
-    print(json_files)
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if 'pagamento' in movimento['tipoMovimento'].lower():
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-                        month = int(date.split('-')[1])
-                        
-                        if year == user_year and month == user_month:
-                            value = movimento['valorMovimento']
-                            category = registro['registro']['naturezaDespesa']['detalhamento' if tipo_de_despesa == TiposDeDespesa.DESPESA else 'elemento']['denominacao']
-
-                            if category not in categories:
-                                categories.add(category)
-                                values_by_category[category] = value
-                            else:
-                                values_by_category[category] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
+    dimensao = dimensao_de(tipo_de_despesa)
 
     # Mostrar apenas as 10 maiores categorias e agrupar o restante em 'Outros'
-    top_categories = sorted_categories[:10]
-    other_categories = sorted_categories[10:]
+    values_by_category = agregar_pagamentos(tipo_de_despesa, dimensao=dimensao, anos=user_year, meses=user_month,
+                                            top=10, outros="demais despesas")
 
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("demais despesas", other_values))
+    top_categories = list(values_by_category.items())
 
     category_labels = [category[0] for category in top_categories]
     category_values = [category[1] for category in top_categories]
@@ -104,38 +85,11 @@ def despesa_por_mes_do_ano(user_year: int, user_month: int, tipo_de_despesa: Tip
         plt.show()
 
 def despesa_acumulada_de_um_ano(user_year: int, tipo_de_despesa: TiposDeDespesa):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and tipo_de_despesa.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if 'pagamento' in movimento['tipoMovimento'].lower():
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-                        
-                        if year == user_year:
-                            value = movimento['valorMovimento']
-                            category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                            if category not in categories:
-                                categories.add(category)
-                                values_by_category[category] = value
-                            else:
-                                values_by_category[category] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
     # Mostrar apenas as 10 maiores categorias e agrupar o restante em 'Outros'
-    top_categories = sorted_categories[:10]
-    other_categories = sorted_categories[10:]
+    values_by_category = agregar_pagamentos(tipo_de_despesa, dimensao='naturezaDespesa.elemento', anos=user_year,
+                                            top=10, outros="Demais despesas")
 
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("Demais despesas", other_values))
+    top_categories = list(values_by_category.items())
 
     category_labels = [category[0] for category in top_categories]
     category_values = [category[1] for category in top_categories]
@@ -174,37 +128,10 @@ def despesa_acumulada_de_um_ano(user_year: int, tipo_de_despesa: TiposDeDespesa)
         plt.show()
 
 def despesa_acumulada_todos_os_anos(tipo_de_despesa: TiposDeDespesa):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and tipo_de_despesa.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if 'pagamento' in movimento['tipoMovimento'].lower():
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-                        
-                        value = movimento['valorMovimento']
-                        category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                        if category not in categories:
-                            categories.add(category)
-                            values_by_category[category] = value
-                        else:
-                            values_by_category[category] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
     # Mostrar apenas as 10 maiores categorias e agrupar o restante em 'Outros'
-    top_categories = sorted_categories[:10]
-    other_categories = sorted_categories[10:]
+    values_by_category = agregar_pagamentos(tipo_de_despesa, dimensao='naturezaDespesa.elemento', top=10, outros="demais despesas")
 
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("demais despesas", other_values))
+    top_categories = list(values_by_category.items())
 
     category_labels = [category[0] for category in top_categories]
     category_values = [category[1] for category in top_categories]
@@ -251,48 +178,17 @@ def despesa_acumulada_todos_os_anos(tipo_de_despesa: TiposDeDespesa):
 
 def despesa_dos_12_meses_de_um_ano(user_year: int, tipo_de_despesa: TiposDeDespesa):
 
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
+    dimensao = dimensao_de(tipo_de_despesa)
 
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and tipo_de_despesa.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if 'pagamento' in movimento['tipoMovimento'].lower():
-                        date = movimento['dataMovimento']
-                        year, month, _ = map(int, date.split('-'))
-                        
-                        if year == user_year:
-                            value = movimento['valorMovimento']
-                            category = registro['registro']['naturezaDespesa']['detalhamento' if tipo_de_despesa == TiposDeDespesa.DESPESA else 'elemento']['denominacao']
-
-                            if category not in categories:
-                                categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = 0
-
-                            values_by_category[month][category] += value
+    # Em cada mês, as 9 maiores categorias e o restante somado em 'demais despesas'
+    values_by_month = agregar_pagamentos(tipo_de_despesa, dimensao=dimensao, grao='mes', anos=user_year,
+                                         top=9, outros='demais despesas')
 
     # Organizar os valores em um formato adequado para o gráfico de barras empilhadas
-    stacked_data = [[] for _ in range(12)]
-
-    for month in range(1, 13):
-        category_values = [(category, values_by_category[month][category]) for category in categories]
-        category_values.sort(key=lambda x: x[1], reverse=True)
-
-        top_categories = category_values[:9]
-        other_value = sum([value for _, value in category_values[9:]])
-
-        for i, category in enumerate(top_categories):
-            stacked_data[month - 1].append(category[1])
-
-        stacked_data[month - 1].append(other_value)
+    stacked_data = [list(values_by_month[month].values()) for month in range(1, 13)]
 
     month_labels = [f'Mês {month}' for month in range(1, 13)]
-    category_labels = [category[0] for category in top_categories] + ['demais despesas']
+    category_labels = list(values_by_month[12])
 
     fig, ax = plt.subplots(figsize=(12, 8))
 
@@ -336,35 +232,11 @@ def salvar_grafico(nome_do_arquivo: str):
     plt.savefig(output_file_path)
 
 def lista_de_despesas(user_year: int):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and "despesa - " in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if True:
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-
-                        if year == user_year:
-                            value = movimento['valorMovimento']
-                            category = movimento['tipoMovimento']
-
-                            if category not in categories:
-                                categories.add(category)
-                                values_by_category[category] = value
-                            else:
-                                values_by_category[category] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
     # Mostrar todas as categorias, não apenas as 10 maiores
-    category_labels = [category[0] for category in sorted_categories]
-    category_values = [category[1] for category in sorted_categories]
+    values_by_category = agregar_arquivos(directory, "despesa - ", Consulta(dimensao='tipoMovimento', anos=user_year, ordenar=True))
+
+    category_labels = list(values_by_category)
+    category_values = list(values_by_category.values())
 
     if not values_by_category:
         print("Não há valores em nenhuma das categorias para o ano especificado.")
@@ -0,0 +1,198 @@
+from collections import namedtuple
+
+from ingestao.cubo import COLUNAS_CUBO, carregar_cubo
+
+# Especificação de uma agregação de valorMovimento:
+# - dimensao: coluna agrupada ('naturezaDespesa.elemento', 'tipoMovimento'...), ou None para o total
+# - tipos_movimento: tipos aceitos (coleção, texto ou função)
+# - grao: None, 'ano' ou 'mes' — com grão o resultado é {período: {categoria: valor}}, com todos
+#   os períodos e todas as categorias (valor 0 quando não há movimento)
+# - anos, meses: um valor ou um intervalo (inicio, fim) inclusivo
+# - rotulo: dicionário ou função aplicada à categoria; categorias com o mesmo rótulo são somadas
+# - ordenar: ordena pelo valor, do maior para o menor
+# - top: mantém as top maiores categorias (em cada período) e soma o restante em `outros`
+Consulta = namedtuple('Consulta', ['dimensao', 'tipos_movimento', 'grao', 'anos', 'meses', 'rotulo', 'ordenar', 'top', 'outros'],
+                      defaults=(None, None, None, None, None, None, False, None, 'Outros'))
+
+
+def teste_de(condicao):
+    if condicao is None or callable(condicao):
+        return condicao
+    if isinstance(condicao, (set, frozenset, list, dict)):
+        return frozenset(condicao).__contains__
+    return lambda valor: valor == condicao
+
+
+def teste_de_intervalo(condicao):
+    if isinstance(condicao, tuple):
+        inicio, fim = condicao
+        return lambda valor: inicio <= valor <= fim
+    return teste_de(condicao)
+
+
+def teste_de_periodo(anos, meses):
+    # Teste periodo(ano, mes) usado para escolher os arquivos e as linhas do cubo
+    teste_ano, teste_mes = teste_de_intervalo(anos), teste_de_intervalo(meses)
+    if teste_ano is None and teste_mes is None:
+        return None
+    return lambda ano, mes: (teste_ano is None or teste_ano(ano)) and (teste_mes is None or teste_mes(mes))
+
+
+def periodos_de(grao, condicao, vistos):
+    if isinstance(condicao, tuple):
+        return list(range(condicao[0], condicao[1] + 1))
+    if condicao is not None:
+        return [condicao]
+    if grao == 'mes':
+        return list(range(1, 13))
+    return sorted(vistos)
+
+
+def manter_maiores(valores, top, outros):
+    ordenados = sorted(valores.items(), key=lambda x: x[1], reverse=True)
+    maiores = dict(ordenados[:top])
+    maiores[outros] = sum(valor for _, valor in ordenados[top:])
+    return maiores
+
+
+# Como manter_maiores, mas para um resultado por período: as top categorias são escolhidas pelo
+# total de todos os períodos, para que sejam as mesmas em todos eles
+def manter_maiores_no_total(valores_por_periodo, top, outros='Outros'):
+    totais = {}
+    for valores in valores_por_periodo.values():
+        for categoria, valor in valores.items():
+            totais[categoria] = totais.get(categoria, 0) + valor
+
+    if top is None or len(totais) <= top:
+        return valores_por_periodo
+
+    maiores = set(sorted(totais, key=totais.get, reverse=True)[:top])
+    reduzidos = {}
+    for periodo, valores in valores_por_periodo.items():
+        reduzidos[periodo] = {categoria: valor for categoria, valor in valores.items() if categoria in maiores}
+        # Uma categoria que já se chama `outros` recebe o restante
+        reduzidos[periodo][outros] = (reduzidos[periodo].get(outros, 0)
+                                      + sum(valor for categoria, valor in valores.items() if categoria not in maiores))
+    return reduzidos
+
+
+def arredondar_valores(valores_por_periodo, casas=2):
+    return {periodo: {categoria: round(valor, casas) for categoria, valor in valores.items()}
+            for periodo, valores in valores_por_periodo.items()}
+
+
+def formatar(valores, consulta):
+    if consulta.top is not None:
+        return manter_maiores(valores, consulta.top, consulta.outros)
+    if consulta.ordenar:
+        return dict(sorted(valores.items(), key=lambda x: x[1], reverse=True))
+    return valores
+
+
+# Posição de cada coluna nas linhas lidas do cubo
+COLUNAS_LINHA = ['valor', 'tipoMovimento', 'ano', 'mes', 'valorMovimento']
+
+
+class Acumulador:
+    def __init__(self, consulta, rotulos=None):
+        self.consulta = consulta
+        self.rotulos = rotulos
+        if consulta.dimensao is None:
+            self.coluna = None
+        else:
+            self.coluna = COLUNAS_LINHA.index(consulta.dimensao if consulta.dimensao in COLUNAS_CUBO else 'valor')
+        self.grao = COLUNAS_LINHA.index(consulta.grao) if consulta.grao else None
+        self.testes = [(COLUNAS_LINHA.index(coluna), teste) for coluna, teste in (
+            ('tipoMovimento', teste_de(consulta.tipos_movimento)),
+            ('ano', teste_de_intervalo(consulta.anos)),
+            ('mes', teste_de_intervalo(consulta.meses))) if teste]
+        self.somas = {}
+
+    def dimensao(self):
+        # Dimensão (fatia do cubo) lida pela consulta; None quando qualquer fatia serve
+        dimensao = self.consulta.dimensao
+        return None if dimensao is None or dimensao in COLUNAS_CUBO else dimensao
+
+    def adicionar(self, linha):
+        for indice, teste in self.testes:
+            if not teste(linha[indice]):
+                return
+
+        chave = (None if self.grao is None else linha[self.grao], None if self.coluna is None else linha[self.coluna])
+        if chave not in self.somas:
+            self.somas[chave] = linha[4]
+        else:
+            self.somas[chave] += linha[4]
+
+    def rotuladas(self):
+        # Os codigos viram denominações (e depois o rótulo da consulta) só no fim, uma vez por
+        # categoria; categorias que ficam com o mesmo rótulo são somadas
+        rotulo = self.consulta.rotulo.__getitem__ if isinstance(self.consulta.rotulo, dict) else self.consulta.rotulo
+
+        somas = {}
+        for (periodo, categoria), value in self.somas.items():
+            if self.rotulos is not None:
+                categoria = self.rotulos.get(categoria, categoria)
+            if rotulo:
+                categoria = rotulo(categoria)
+
+            if (periodo, categoria) not in somas:
+                somas[(periodo, categoria)] = value
+            else:
+                somas[(periodo, categoria)] += value
+        return somas
+
+    def resultado(self):
+        consulta = self.consulta
+        somas = self.rotuladas()
+
+        if consulta.grao is None:
+            valores = {categoria: value for (_, categoria), value in somas.items()}
+            return formatar(valores, consulta) if valores else valores
+
+        categorias = list(dict.fromkeys(categoria for _, categoria in somas))
+        periodos = periodos_de(consulta.grao, consulta.anos if consulta.grao == 'ano' else consulta.meses,
+                               set(periodo for periodo, _ in somas))
+
+        return {periodo: formatar({categoria: somas.get((periodo, categoria), 0) for categoria in categorias}, consulta)
+                for periodo in periodos}
+
+
+# Executa várias consultas juntas: cada fatia do cubo usada por alguma delas é percorrida
+# uma única vez, e cada linha é entregue a todas as consultas daquela fatia
+def agregar_varias(cubo, consultas):
+    acumuladores = {nome: Acumulador(consulta, cubo.rotulos.get(consulta.dimensao)) for nome, consulta in consultas.items()}
+
+    por_fatia = {}
+    for acumulador in acumuladores.values():
+        por_fatia.setdefault(acumulador.dimensao(), []).append(acumulador)
+
+    # As consultas sem dimensão aproveitam uma fatia que já vai ser percorrida
+    sem_dimensao = por_fatia.pop(None, [])
+    if sem_dimensao:
+        dimensao = next((dimensao for dimensao in por_fatia if cubo.fatia(dimensao) is not None), None)
+        por_fatia.setdefault(dimensao, []).extend(sem_dimensao)
+
+    for dimensao, acumuladores_da_fatia in por_fatia.items():
+        fatia = cubo.fatia(dimensao)
+        if fatia is None:
+            continue
+
+        for linha in fatia.linhas(*COLUNAS_LINHA):
+            for acumulador in acumuladores_da_fatia:
+                acumulador.adicionar(linha)
+
+    return {nome: acumulador.resultado() for nome, acumulador in acumuladores.items()}
+
+
+def agregar(cubo, consulta):
+    return agregar_varias(cubo, {None: consulta})[None]
+
+
+def agregar_arquivos(directory, tipo, consulta, user_year=0):
+    # Com o banco SQLite em dia, a soma é feita por ele
+    from ingestao.banco import agregar_banco, banco_atualizado
+    if banco_atualizado(directory, tipo, user_year):
+        return agregar_banco(directory, tipo, {None: consulta}, user_year)[None]
+
+    return agregar(carregar_cubo(directory, tipo, user_year, teste_de_periodo(consulta.anos, consulta.meses)), consulta)
@@ -0,0 +1,36 @@
+import threading
+
+
+# Armazém de dados compartilhado por todas as sessões (e threads) do processo. Cada chave
+# guarda um único snapshot (versão, dados): ele é carregado uma vez, só é lido depois disso
+# e, quando a versão dos arquivos muda, é trocado de uma vez pelo novo. Quem ainda está
+# usando o snapshot antigo continua com ele até terminar; nenhuma versão antiga fica guardada.
+# Os dados devolvidos não devem ser alterados
+class Armazem:
+    def __init__(self):
+        self.snapshots = {}
+        self.travas = {}
+        self.trava = threading.Lock()
+
+    def trava_da_chave(self, chave):
+        with self.trava:
+            return self.travas.setdefault(chave, threading.Lock())
+
+    def obter(self, chave, versao, carregar):
+        # Leitura sem trava: a troca do snapshot é uma única atribuição
+        snapshot = self.snapshots.get(chave)
+        if snapshot is not None and snapshot[0] == versao:
+            return snapshot[1]
+
+        # Só uma thread carrega cada chave; as outras esperam e usam o mesmo snapshot
+        with self.trava_da_chave(chave):
+            snapshot = self.snapshots.get(chave)
+            if snapshot is not None and snapshot[0] == versao:
+                return snapshot[1]
+
+            dados = carregar()
+            self.snapshots[chave] = (versao, dados)
+            return dados
+
+
+armazem = Armazem()
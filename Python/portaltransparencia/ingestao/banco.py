@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+
+from ingestao.agregacao import Acumulador, teste_de
+from ingestao.cubo import COLUNAS_CUBO
+from ingestao.leitor import iterar_registros
+from ingestao.tabela import (COLUNAS_ITENS, DIMENSOES_DESPESA, DIMENSOES_RECEITA, SEM_CODIGO, Tabela, ano_do_arquivo,
+                             codigo_de, dimensao, dimensoes_do_arquivo, nova_coluna, novas_colunas, versao_arquivos)
+
+# Banco SQLite opcional com os registros, movimentos e itens de empenho de dados/. Ele só é
+# usado pelas consultas quando existe e está em dia com os arquivos (atualizar_banco cria e
+# atualiza o banco; o webscrapper o atualiza depois de cada download quando ele existe)
+ARQUIVO_BANCO = 'portal.sqlite'
+
+# Versão do esquema, guardada em PRAGMA user_version: um banco de outra versão não é usado pelas
+# consultas e é recriado por atualizar_banco
+VERSAO_BANCO = 2
+
+DIMENSOES = {**DIMENSOES_DESPESA, **DIMENSOES_RECEITA}
+
+
+def coluna_sql(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+
+TABELAS = f"""
+CREATE TABLE IF NOT EXISTS arquivos (
+    id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE NOT NULL,
+    exercicio INTEGER NOT NULL,
+    versao TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registros (
+    id INTEGER PRIMARY KEY,
+    arquivo INTEGER NOT NULL REFERENCES arquivos(id),
+    {', '.join(f'{coluna_sql(nome)} TEXT' for nome in DIMENSOES)}
+);
+CREATE TABLE IF NOT EXISTS movimentos (
+    id INTEGER PRIMARY KEY,
+    registro INTEGER NOT NULL REFERENCES registros(id),
+    tipoMovimento TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    valorMovimento REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS itens (
+    id INTEGER PRIMARY KEY,
+    registro INTEGER NOT NULL REFERENCES registros(id),
+    {', '.join(f'{coluna_sql(nome)}' for nome in COLUNAS_ITENS if nome != 'exercicio')}
+);
+CREATE TABLE IF NOT EXISTS dimensoes (
+    arquivo INTEGER NOT NULL REFERENCES arquivos(id),
+    dimensao TEXT NOT NULL,
+    codigo TEXT,
+    denominacao TEXT
+);
+CREATE INDEX IF NOT EXISTS movimentos_tipo_ano_mes ON movimentos (tipoMovimento, ano, mes);
+CREATE INDEX IF NOT EXISTS movimentos_registro ON movimentos (registro);
+CREATE INDEX IF NOT EXISTS itens_ano_mes ON itens (ano, mes);
+CREATE INDEX IF NOT EXISTS registros_arquivo ON registros (arquivo);
+{''.join(f'CREATE INDEX IF NOT EXISTS registros_{posicao} ON registros ({coluna_sql(nome)});' for posicao, nome in enumerate(DIMENSOES))}
+"""
+
+
+def caminho_banco(directory):
+    return os.path.join(directory, ARQUIVO_BANCO)
+
+
+def conectar(directory, somente_leitura=True):
+    # Cada leitor abre a sua conexão; com o journal WAL as leituras não esperam pela escrita
+    caminho = caminho_banco(directory)
+    if somente_leitura:
+        return sqlite3.connect(f'file:{caminho}?mode=ro', uri=True, check_same_thread=False)
+    return sqlite3.connect(caminho)
+
+
+def inserir_arquivo(conexao, directory, filename, versao):
+    exercicio = ano_do_arquivo(filename)
+    dimensoes = dimensoes_do_arquivo(filename)
+
+    arquivo = conexao.execute('INSERT INTO arquivos (filename, exercicio, versao) VALUES (?, ?, ?)',
+                              (filename, exercicio, versao)).lastrowid
+
+    colunas_registro = ', '.join(coluna_sql(nome) for nome in dimensoes)
+    sql_registro = f'INSERT INTO registros (arquivo, {colunas_registro}) VALUES (?{", ?" * len(dimensoes)})'
+    sql_item = f'INSERT INTO itens (registro, {", ".join(coluna_sql(nome) for nome in COLUNAS_ITENS[1:])}) ' \
+               f'VALUES (?{", ?" * (len(COLUNAS_ITENS) - 1)})'
+
+    valores_dimensoes = {}
+    for registro in iterar_registros(os.path.join(directory, filename)):
+        registro = registro['registro']
+
+        codigos = []
+        for nome, caminho in dimensoes.items():
+            valor = dimensao(registro, caminho)
+            codigo = SEM_CODIGO if valor is None else codigo_de(valor)
+            valores_dimensoes[(nome, codigo)] = None if valor is None else valor['denominacao']
+            codigos.append(codigo)
+
+        id_registro = conexao.execute(sql_registro, [arquivo] + codigos).lastrowid
+
+        movimentos = []
+        for movimento in registro['listMovimentos']:
+            data = movimento['dataMovimento']
+            movimentos.append((id_registro, movimento['tipoMovimento'], int(data[:4]), int(data[5:7]), movimento['valorMovimento']))
+        conexao.executemany('INSERT INTO movimentos (registro, tipoMovimento, ano, mes, valorMovimento) VALUES (?, ?, ?, ?, ?)',
+                            movimentos)
+
+        if not registro.get('listEmpenhoItens'):
+            continue
+
+        emissao = registro['empenho']['emissao']
+        elemento = dimensao(registro, DIMENSOES_DESPESA['naturezaDespesa.elemento'])['denominacao']
+        conexao.executemany(sql_item, [
+            (id_registro, int(emissao[:4]), int(emissao[5:7]), emissao, elemento, empenho_item['denominacao'],
+             empenho_item['quantidade'], empenho_item['unidadeMedida']['sigla'], empenho_item['valorUnitario'],
+             empenho_item['quantidade'] * empenho_item['valorUnitario'])
+            for empenho_item in registro['listEmpenhoItens']])
+
+    conexao.executemany('INSERT INTO dimensoes (arquivo, dimensao, codigo, denominacao) VALUES (?, ?, ?, ?)',
+                        [(arquivo, nome, codigo, denominacao) for (nome, codigo), denominacao in valores_dimensoes.items()])
+
+
+def remover_arquivo(conexao, arquivo):
+    registros = 'SELECT id FROM registros WHERE arquivo = ?'
+    conexao.execute(f'DELETE FROM movimentos WHERE registro IN ({registros})', (arquivo,))
+    conexao.execute(f'DELETE FROM itens WHERE registro IN ({registros})', (arquivo,))
+    conexao.execute('DELETE FROM registros WHERE arquivo = ?', (arquivo,))
+    conexao.execute('DELETE FROM dimensoes WHERE arquivo = ?', (arquivo,))
+    conexao.execute('DELETE FROM arquivos WHERE id = ?', (arquivo,))
+
+
+def versoes_do_diretorio(directory, tipo=' - ', user_year=0):
+    # A versão de cada arquivo é a mesma usada pelos caches (hash do manifesto ou tamanho e data)
+    return {versao[0]: json.dumps(versao[1:]) for versao in versao_arquivos(directory, tipo, user_year)}
+
+
+# Cria o banco, ou recarrega só os arquivos que mudaram desde a última atualização
+def atualizar_banco(directory):
+    versoes = versoes_do_diretorio(directory)
+
+    with conectar(directory, somente_leitura=False) as conexao:
+        conexao.execute('PRAGMA journal_mode=WAL')
+        if conexao.execute('PRAGMA user_version').fetchone()[0] != VERSAO_BANCO:
+            conexao.executescript('DROP TABLE IF EXISTS dimensoes; DROP TABLE IF EXISTS itens; DROP TABLE IF EXISTS movimentos; '
+                                  'DROP TABLE IF EXISTS registros; DROP TABLE IF EXISTS arquivos;')
+            conexao.execute(f'PRAGMA user_version = {VERSAO_BANCO}')
+        conexao.executescript(TABELAS)
+
+        # Sai do banco o arquivo que mudou ou que não existe mais
+        for arquivo, filename, versao in conexao.execute('SELECT id, filename, versao FROM arquivos').fetchall():
+            if versoes.get(filename) != versao:
+                remover_arquivo(conexao, arquivo)
+
+        carregados = {filename for filename, in conexao.execute('SELECT filename FROM arquivos')}
+        for filename, versao in versoes.items():
+            if filename not in carregados:
+                inserir_arquivo(conexao, directory, filename, versao)
+                conexao.commit()
+                print(f"Arquivo {filename} carregado no banco {caminho_banco(directory)}.")
+    conexao.close()
+
+
+def banco_atualizado(directory, tipo, user_year=0):
+    if not os.path.exists(caminho_banco(directory)):
+        return False
+
+    versoes = versoes_do_diretorio(directory, tipo, user_year)
+    conexao = conectar(directory)
+    try:
+        if conexao.execute('PRAGMA user_version').fetchone()[0] != VERSAO_BANCO:
+            return False
+        carregados = {filename: versao for filename, exercicio, versao
+                      in conexao.execute('SELECT filename, exercicio, versao FROM arquivos')
+                      if do_tipo(filename, exercicio, tipo, user_year)}
+    except sqlite3.Error:
+        return False
+    finally:
+        conexao.close()
+
+    # Linhas de arquivos apagados ou renomeados também deixam o banco desatualizado: elas só
+    # saem em atualizar_banco, e até lá entrariam nas agregações
+    return carregados == versoes
+
+
+def do_tipo(filename, exercicio, tipo, user_year=0):
+    # Mesma seleção de arquivos de listar_arquivos
+    return tipo in filename.lower() and (user_year == 0 or exercicio == user_year)
+
+
+def arquivos_do_tipo(conexao, tipo, user_year=0):
+    return [arquivo for arquivo, filename, exercicio in conexao.execute('SELECT id, filename, exercicio FROM arquivos')
+            if do_tipo(filename, exercicio, tipo, user_year)]
+
+
+def filtro_sql(conexao, coluna, condicao, intervalo):
+    # Traduz uma condição da Consulta em SQL; funções são aplicadas aos valores distintos da
+    # coluna (poucos, e lidos pelo índice) e viram uma lista IN
+    if condicao is None:
+        return '1', []
+    if intervalo and isinstance(condicao, tuple):
+        return f'm.{coluna} BETWEEN ? AND ?', list(condicao)
+    if not callable(condicao) and not isinstance(condicao, (set, frozenset, list, dict)):
+        return f'm.{coluna} = ?', [condicao]
+
+    teste = teste_de(condicao)
+    valores = [valor for valor, in conexao.execute(f'SELECT DISTINCT {coluna} FROM movimentos') if teste(valor)]
+    return f'm.{coluna} IN ({", ".join("?" * len(valores))})', valores
+
+
+def consultar_agregacao(conexao, arquivos, consulta):
+    # Devolve as linhas no formato do cubo (valor, tipoMovimento, ano, mes, soma) e na mesma ordem
+    # das linhas do cubo: por arquivo, por (ano, mês) e pela ordem em que cada chave aparece
+    if consulta.dimensao is None or consulta.dimensao in COLUNAS_CUBO:
+        valor = 'NULL' if consulta.dimensao is None else f'm.{consulta.dimensao}'
+    else:
+        valor = f'r.{coluna_sql(consulta.dimensao)}'
+
+    filtros = [filtro_sql(conexao, 'tipoMovimento', consulta.tipos_movimento, False),
+               filtro_sql(conexao, 'ano', consulta.anos, True),
+               filtro_sql(conexao, 'mes', consulta.meses, True)]
+
+    sql = f"""
+        SELECT {valor}, m.tipoMovimento, m.ano, m.mes, SUM(m.valorMovimento)
+        FROM movimentos m JOIN registros r ON r.id = m.registro JOIN arquivos a ON a.id = r.arquivo
+        WHERE r.arquivo IN ({', '.join('?' * len(arquivos))}) AND {' AND '.join(filtro for filtro, _ in filtros)}
+        GROUP BY 1, 2, 3, 4
+        ORDER BY MIN(a.filename), m.ano, m.mes, MIN(m.id)
+    """
+    return conexao.execute(sql, arquivos + [parametro for _, parametros in filtros for parametro in parametros])
+
+
+def rotulos_do_banco(conexao, arquivos):
+    # Se a denominação de um codigo mudou entre os anos, vale a mais recente
+    rotulos = {}
+    for nome, codigo, denominacao in conexao.execute(f"""
+            SELECT d.dimensao, d.codigo, d.denominacao FROM dimensoes d JOIN arquivos a ON a.id = d.arquivo
+            WHERE a.id IN ({', '.join('?' * len(arquivos))}) ORDER BY a.exercicio""", arquivos):
+        rotulos.setdefault(nome, {})[codigo] = denominacao
+    return rotulos
+
+
+# Mesma interface de agregar_varias, com as somas feitas pelo SQLite
+def agregar_banco(directory, tipo, consultas, user_year=0):
+    conexao = conectar(directory)
+    try:
+        arquivos = arquivos_do_tipo(conexao, tipo, user_year)
+        rotulos = rotulos_do_banco(conexao, arquivos)
+
+        resultados = {}
+        for nome, consulta in consultas.items():
+            acumulador = Acumulador(consulta, rotulos.get(consulta.dimensao))
+            for linha in consultar_agregacao(conexao, arquivos, consulta):
+                acumulador.adicionar(linha)
+            resultados[nome] = acumulador.resultado()
+        return resultados
+    finally:
+        conexao.close()
+
+
+def carregar_itens(directory, tipo, user_year=0):
+    conexao = conectar(directory)
+    try:
+        arquivos = arquivos_do_tipo(conexao, tipo, user_year)
+
+        linhas = conexao.execute(f"""
+            SELECT a.exercicio, {', '.join(f'i.{coluna_sql(nome)}' for nome in COLUNAS_ITENS[1:])}
+            FROM itens i JOIN registros r ON r.id = i.registro JOIN arquivos a ON a.id = r.arquivo
+            WHERE a.id IN ({', '.join('?' * len(arquivos))}) ORDER BY i.id""", arquivos).fetchall()
+        if not linhas:
+            return Tabela(novas_colunas(COLUNAS_ITENS))
+        return Tabela({nome: nova_coluna(nome, valores=valores) for nome, valores in zip(COLUNAS_ITENS, zip(*linhas))})
+    finally:
+        conexao.close()
+
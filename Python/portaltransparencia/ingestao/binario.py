@@ -0,0 +1,197 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from datetime import date
+
+from ingestao.cubo import COLUNAS_CUBO, COLUNAS_INDICE
+from ingestao.tabela import TIPOS_EM_MEMORIA
+
+# Colunas binárias de cada partição (parquet/v4/tipo=.../ano=.../colunas/): um arquivo por
+# coluna, com os valores crus na ordem de bytes da máquina, prontos para serem mapeados em
+# memória (mmap) sem nenhuma conversão. Vários processos que mapeiam os mesmos arquivos
+# compartilham as mesmas páginas do cache do sistema operacional
+DIRETORIO_BINARIO = 'colunas'
+
+# esquema.json descreve as tabelas (linhas e tipo de cada coluna) e guarda a tabela de textos
+# da partição; é gravado por último, depois de todas as colunas
+ESQUEMA = 'esquema.json'
+
+# Textos e datas são gravados como int32: a posição do texto na tabela de textos (-1 para None)
+# e o número de dias desde 1970-01-01
+TEXTO = 'texto'
+DATA = 'data'
+TIPO_INT32 = 'i'
+
+# Posições de linhas do cubo, no índice de cada partição
+TIPO_POSICAO = 'q'
+EPOCA = date(1970, 1, 1).toordinal()
+
+COLUNAS_DATA = {'emissao'}
+
+TIPOS_CUBO = {'dimensao': TEXTO, 'valor': TEXTO, 'tipoMovimento': TEXTO, 'ano': 'h', 'mes': 'b', 'valorMovimento': 'd'}
+
+TIPOS_INDICE = {'dimensao': TEXTO, 'ano': 'h', 'mes': 'b', 'inicio': TIPO_POSICAO, 'fim': TIPO_POSICAO}
+
+TIPOS_DIMENSOES = {'dimensao': TEXTO, 'codigo': TEXTO, 'denominacao': TEXTO}
+
+
+def tipos_de(colunas):
+    # O exercício não é gravado: ele já está no caminho da partição (ano=...). As colunas de
+    # dimensão (codigos da API) são textos
+    tipos = {}
+    for nome in colunas:
+        if nome == 'exercicio':
+            continue
+        if nome in COLUNAS_DATA:
+            tipos[nome] = DATA
+        else:
+            tipos[nome] = TIPOS_EM_MEMORIA.get(nome, TEXTO)
+    return tipos
+
+
+def dias_de(data):
+    return date.fromisoformat(data[:10]).toordinal() - EPOCA
+
+
+def data_de(dias):
+    return date.fromordinal(EPOCA + dias).isoformat()
+
+
+def caminho_coluna(destino, tabela, coluna):
+    return os.path.join(destino, f'{tabela}.{coluna}.bin')
+
+
+def escrever_arquivo(caminho, escrever):
+    # Cada arquivo é trocado de uma vez: quem já mapeou a versão anterior continua com ela
+    temporario = caminho + '.tmp'
+    with open(temporario, 'wb') as arquivo:
+        escrever(arquivo)
+    os.replace(temporario, caminho)
+
+
+# `tabelas` é {nome: (colunas, tipos)}; os textos de todas as tabelas vão para uma única tabela de textos
+def gravar_colunas(caminho, tabelas):
+    destino = os.path.join(caminho, DIRETORIO_BINARIO)
+    os.makedirs(destino, exist_ok=True)
+
+    textos = {}
+
+    def posicao_do_texto(texto):
+        if texto is None:
+            return -1
+        if texto not in textos:
+            textos[texto] = len(textos)
+        return textos[texto]
+
+    esquema = {'tabelas': {}}
+    for tabela, (colunas, tipos) in tabelas.items():
+        linhas = None
+        for coluna, tipo in tipos.items():
+            valores = colunas[coluna]
+            if tipo == TEXTO:
+                valores = array(TIPO_INT32, map(posicao_do_texto, valores))
+            elif tipo == DATA:
+                valores = array(TIPO_INT32, map(dias_de, valores))
+            elif not isinstance(valores, array) or valores.typecode != tipo:
+                valores = array(tipo, valores)
+
+            linhas = len(valores)
+            escrever_arquivo(caminho_coluna(destino, tabela, coluna), valores.tofile)
+        esquema['tabelas'][tabela] = {'linhas': linhas or 0, 'tipos': tipos}
+
+    esquema['textos'] = list(textos)
+    escrever_arquivo(os.path.join(destino, ESQUEMA),
+                     lambda arquivo: arquivo.write(json.dumps(esquema, ensure_ascii=False).encode('utf-8')))
+
+
+def possui_colunas(caminho):
+    return os.path.exists(os.path.join(caminho, DIRETORIO_BINARIO, ESQUEMA))
+
+
+# Coluna mapeada de textos ou datas: guarda só os int32 do arquivo e converte cada valor
+# quando ele é lido
+class ColunaConvertida:
+    def __init__(self, valores, converter):
+        self.valores = valores
+        self.converter = converter
+
+    def __len__(self):
+        return len(self.valores)
+
+    def __getitem__(self, posicao):
+        if isinstance(posicao, slice):
+            return [self.converter(valor) for valor in self.valores[posicao]]
+        return self.converter(self.valores[posicao])
+
+    def __iter__(self):
+        return map(self.converter, self.valores)
+
+
+def mapear(caminho, tipo):
+    # mmap não aceita arquivos vazios
+    if os.path.getsize(caminho) == 0:
+        return array(tipo)
+    with open(caminho, 'rb') as arquivo:
+        return memoryview(mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)).cast(tipo)
+
+
+def ler_esquema(caminho):
+    with open(os.path.join(caminho, DIRETORIO_BINARIO, ESQUEMA), encoding='utf-8') as arquivo:
+        esquema = json.load(arquivo)
+
+    # A posição -1 (sem texto) cai no None do final da lista
+    esquema['textos'] = [sys.intern(texto) for texto in esquema['textos']] + [None]
+    return esquema
+
+
+def ler_tabela(caminho, esquema, tabela, colunas=None):
+    destino = os.path.join(caminho, DIRETORIO_BINARIO)
+    tipos = esquema['tabelas'][tabela]['tipos']
+    textos = esquema['textos'].__getitem__
+
+    lidas = {}
+    for coluna in tipos if colunas is None else colunas:
+        if coluna not in tipos:
+            continue
+        tipo = tipos[coluna]
+        valores = mapear(caminho_coluna(destino, tabela, coluna), TIPO_INT32 if tipo in (TEXTO, DATA) else tipo)
+        if tipo == TEXTO:
+            valores = ColunaConvertida(valores, textos)
+        elif tipo == DATA:
+            valores = ColunaConvertida(valores, data_de)
+        lidas[coluna] = valores
+    return lidas
+
+
+def com_exercicio(colunas, exercicio, linhas):
+    colunas['exercicio'] = array(TIPOS_EM_MEMORIA['exercicio'], [exercicio]) * linhas
+    return colunas
+
+
+# Mesmas funções de leitura de ingestao/parquet.py, mas sem decodificar nada: as colunas
+# numéricas são memoryviews sobre os arquivos mapeados
+def ler_particao(caminho, exercicio, colunas=None):
+    esquema = ler_esquema(caminho)
+
+    movimentos = ler_tabela(caminho, esquema, 'movimentos', colunas)
+    if colunas is None or 'exercicio' in colunas:
+        com_exercicio(movimentos, exercicio, esquema['tabelas']['movimentos']['linhas'])
+
+    itens = com_exercicio(ler_tabela(caminho, esquema, 'itens'), exercicio, esquema['tabelas']['itens']['linhas'])
+
+    return movimentos, itens
+
+
+def ler_cubo(caminho):
+    return ler_tabela(caminho, ler_esquema(caminho), 'cubo', COLUNAS_CUBO)
+
+
+def ler_indice(caminho):
+    return ler_tabela(caminho, ler_esquema(caminho), 'indice', COLUNAS_INDICE)
+
+
+def ler_dimensoes(caminho):
+    dimensoes = ler_tabela(caminho, ler_esquema(caminho), 'dimensoes')
+    return {(nome, codigo): denominacao for nome, codigo, denominacao in zip(dimensoes['dimensao'], dimensoes['codigo'], dimensoes['denominacao'])}
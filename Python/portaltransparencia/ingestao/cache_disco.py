@@ -0,0 +1,129 @@
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import time
+
+# Cache em disco dos resultados do painel (agregações e figuras já em JSON): sobrevive ao
+# reinício do processo e é compartilhado por todos os processos que leem o mesmo diretório.
+# O código que calcula as entradas faz parte da chave (versao_do_codigo); a versão faz parte do
+# caminho e só precisa mudar quando o resultado muda por outro motivo (uma biblioteca, por
+# exemplo). Entradas de outra versão são ignoradas e apagadas na próxima limpeza
+VERSAO_CACHE = 'v2'
+DIRETORIO_CACHE = os.path.join('cache', VERSAO_CACHE)
+
+# Limpeza feita no máximo uma vez por intervalo em cada processo, depois de gravar uma entrada:
+# apaga os diretórios das outras versões, as entradas sem uso há mais de IDADE_MAXIMA e, se o
+# cache ainda passar de TAMANHO_MAXIMO, as entradas usadas há mais tempo
+IDADE_MAXIMA = 30 * 24 * 3600
+TAMANHO_MAXIMO = 512 * 1024 * 1024
+INTERVALO_LIMPEZA = 3600
+
+ultima_limpeza = None
+
+# {caminho: (mtime_ns, sha256)} dos arquivos de código já lidos
+resumos_de_arquivo = {}
+
+
+# A chave é uma tupla de valores simples (textos, números, None e tuplas), como
+# (gráfico, parâmetros, versão dos dados). Conjuntos não servem: o repr deles muda de ordem
+# entre processos, e a mesma chave cairia em caminhos diferentes
+def caminho_da_entrada(directory, chave):
+    resumo = hashlib.sha256(repr(chave).encode('utf-8')).hexdigest()
+    return os.path.join(directory, DIRETORIO_CACHE, resumo[:2], resumo + '.pickle')
+
+
+def resumo_do_arquivo(caminho):
+    mtime = os.stat(caminho).st_mtime_ns
+    guardado = resumos_de_arquivo.get(caminho)
+    if guardado is None or guardado[0] != mtime:
+        with open(caminho, 'rb') as arquivo:
+            guardado = (mtime, hashlib.sha256(arquivo.read()).hexdigest())
+        resumos_de_arquivo[caminho] = guardado
+    return guardado[1]
+
+
+def versao_do_codigo(calcular):
+    # Os módulos de ingestao/ (leitura, cubo, agregação...) e o arquivo onde `calcular` foi definido
+    # (o script do painel, com as consultas e os gráficos): qualquer mudança neles muda a chave
+    arquivos = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py')))
+    origem = inspect.getsourcefile(calcular)
+    if origem and os.path.exists(origem):
+        arquivos.append(os.path.abspath(origem))
+    return hashlib.sha256(''.join(resumo_do_arquivo(caminho) for caminho in arquivos).encode()).hexdigest()
+
+
+def resumo_de(valores):
+    # Identifica um resultado pelo conteúdo, para usá-lo na chave de quem depende dele
+    return hashlib.sha256(pickle.dumps(valores)).hexdigest()
+
+
+def apagar(caminho):
+    # Outro processo pode ter apagado ou trocado o arquivo antes
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def limpar_cache(directory):
+    raiz = os.path.join(directory, 'cache')
+    for nome in os.listdir(raiz):
+        if nome != VERSAO_CACHE:
+            shutil.rmtree(os.path.join(raiz, nome), ignore_errors=True)
+
+    # A data de modificação das entradas é a do último uso (obter_em_disco a atualiza a cada leitura)
+    entradas = []
+    for pasta, _, arquivos in os.walk(os.path.join(directory, DIRETORIO_CACHE)):
+        for nome in arquivos:
+            caminho = os.path.join(pasta, nome)
+            try:
+                stat = os.stat(caminho)
+            except OSError:
+                continue
+            entradas.append((stat.st_mtime, stat.st_size, caminho))
+
+    limite = time.time() - IDADE_MAXIMA
+    tamanho = 0
+    for usada_em, tamanho_entrada, caminho in sorted(entradas, reverse=True):
+        # Um temporário recente ainda pode estar sendo gravado por outro processo
+        if caminho.endswith('.tmp') and usada_em >= limite:
+            continue
+        if usada_em < limite or tamanho + tamanho_entrada > TAMANHO_MAXIMO:
+            apagar(caminho)
+        else:
+            tamanho += tamanho_entrada
+
+
+def obter_em_disco(directory, chave, calcular):
+    global ultima_limpeza
+
+    caminho = caminho_da_entrada(directory, (versao_do_codigo(calcular), chave))
+    try:
+        with open(caminho, 'rb') as arquivo:
+            valor = pickle.load(arquivo)
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return valor
+    except FileNotFoundError:
+        pass
+    except (EOFError, pickle.UnpicklingError) as e:
+        print(f"Entrada de cache inválida em {caminho}, recalculando: {e}")
+
+    valor = calcular()
+
+    # Gravação atômica: outro processo lê a entrada inteira ou não a encontra
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        pickle.dump(valor, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, caminho)
+
+    if ultima_limpeza is None or time.monotonic() - ultima_limpeza > INTERVALO_LIMPEZA:
+        ultima_limpeza = time.monotonic()
+        limpar_cache(directory)
+    return valor
@@ -0,0 +1,141 @@
+from itertools import groupby
+
+from ingestao.leitor import listar_arquivos
+from ingestao.tabela import (Tabela, achatar_arquivo, ano_do_arquivo, caminho_particao, dimensoes_do_arquivo, leitor_da_particao,
+                             novas_colunas, particao_atualizada)
+
+COLUNAS_CUBO = ['dimensao', 'valor', 'tipoMovimento', 'ano', 'mes', 'valorMovimento']
+
+COLUNAS_INDICE = ['dimensao', 'ano', 'mes', 'inicio', 'fim']
+
+
+# Cubo pré-agregado: soma de valorMovimento por (tipoMovimento, ano, mês, codigo de uma dimensão),
+# uma fatia por dimensão. Dentro de cada (dimensão, ano, mês) as linhas ficam na ordem em que
+# cada chave aparece nos movimentos, então as somas saem na mesma ordem que sairiam deles.
+# `rotulos` é o dicionário {dimensão: {codigo: denominação}} usado para exibir os resultados
+class Cubo:
+    def __init__(self, colunas, valores_dimensoes):
+        self.rotulos = {}
+        for (dimensao, codigo), denominacao in valores_dimensoes.items():
+            self.rotulos.setdefault(dimensao, {})[codigo] = denominacao
+
+        fatias = {}
+        for linha in zip(*(colunas[nome] for nome in COLUNAS_CUBO)):
+            fatia = fatias.setdefault(linha[0], novas_colunas(COLUNAS_CUBO[1:]))
+            for nome, valor in zip(COLUNAS_CUBO[1:], linha[1:]):
+                fatia[nome].append(valor)
+
+        self.fatias = {dimensao: Tabela(fatia) for dimensao, fatia in fatias.items()}
+
+    def fatia(self, dimensao):
+        if dimensao is None:
+            # Sem dimensão, qualquer fatia soma todos os movimentos
+            return next(iter(self.fatias.values()), None)
+        return self.fatias.get(dimensao)
+
+
+def montar_cubo(movimentos, dimensoes):
+    somas = {}
+    for dimensao in dimensoes:
+        for chave, value in zip(zip(movimentos[dimensao], movimentos['tipoMovimento'], movimentos['ano'], movimentos['mes']),
+                                movimentos['valorMovimento']):
+            chave = (dimensao,) + chave
+            if chave not in somas:
+                somas[chave] = value
+            else:
+                somas[chave] += value
+
+    # Ordena por (dimensão, ano, mês) para que cada período ocupe um intervalo de linhas
+    ordem = {dimensao: posicao for posicao, dimensao in enumerate(dimensoes)}
+    linhas = sorted(somas.items(), key=lambda linha: (ordem[linha[0][0]], linha[0][3], linha[0][4]))
+
+    colunas = {nome: [] for nome in COLUNAS_CUBO}
+    for chave, value in linhas:
+        for nome, valor in zip(COLUNAS_CUBO, chave + (value,)):
+            colunas[nome].append(valor)
+    return colunas
+
+
+# Índice de partição: para cada (ano, mês) de movimento, os intervalos de linhas do cubo do
+# arquivo com aqueles movimentos, um por dimensão: {(ano, mes): [(dimensao, inicio, fim)]}
+def indexar_cubo(colunas):
+    indice = {}
+    inicio = 0
+    for (dimensao, ano, mes), linhas in groupby(zip(colunas['dimensao'], colunas['ano'], colunas['mes'])):
+        fim = inicio + sum(1 for _ in linhas)
+        indice.setdefault((ano, mes), []).append((dimensao, inicio, fim))
+        inicio = fim
+    return indice
+
+
+def colunas_do_indice(indice):
+    colunas = {nome: [] for nome in COLUNAS_INDICE}
+    for (ano, mes), intervalos in indice.items():
+        for dimensao, inicio, fim in intervalos:
+            for nome, valor in zip(COLUNAS_INDICE, (dimensao, ano, mes, inicio, fim)):
+                colunas[nome].append(valor)
+    return colunas
+
+
+def indice_das_colunas(colunas):
+    indice = {}
+    for dimensao, ano, mes, inicio, fim in zip(*(colunas[nome] for nome in COLUNAS_INDICE)):
+        indice.setdefault((ano, mes), []).append((dimensao, inicio, fim))
+    return indice
+
+
+def recortar_cubo(colunas, indice, periodo):
+    # Mantém só as linhas dos períodos aceitos por periodo(ano, mes), sem olhar linha por linha
+    intervalos = sorted((inicio, fim) for (ano, mes), intervalos_periodo in indice.items() if periodo(ano, mes)
+                        for _, inicio, fim in intervalos_periodo)
+    return {nome: [valor for inicio, fim in intervalos for valor in coluna[inicio:fim]] for nome, coluna in colunas.items()}
+
+
+def ler_indice_do_arquivo(directory, filename):
+    # Só as partições guardam o índice; sem ela o arquivo precisa ser lido
+    if not particao_atualizada(directory, filename):
+        return None
+
+    caminho = caminho_particao(directory, filename)
+    return indice_das_colunas(leitor_da_particao(caminho).ler_indice(caminho))
+
+
+def ler_cubo_do_arquivo(directory, filename):
+    # Usa o cubo gravado na partição quando ela estiver em dia com o .json
+    if particao_atualizada(directory, filename):
+        caminho = caminho_particao(directory, filename)
+        leitor = leitor_da_particao(caminho)
+        return leitor.ler_cubo(caminho), leitor.ler_dimensoes(caminho)
+
+    movimentos, _, valores_dimensoes = achatar_arquivo(directory, filename)
+    return montar_cubo(movimentos, dimensoes_do_arquivo(filename)), valores_dimensoes
+
+
+# `periodo(ano, mes)` seleciona os movimentos pela data, em qualquer arquivo: os restos a pagar
+# de um ano, por exemplo, ficam nos arquivos dos exercícios anteriores. Os arquivos sem nenhum
+# período aceito (pelo índice da partição) nem são lidos
+def carregar_cubo(directory, tipo, user_year=0, periodo=None):
+    colunas = {nome: [] for nome in COLUNAS_CUBO}
+    valores_por_ano = []
+
+    for filename in listar_arquivos(directory, tipo, user_year):
+        indice = None
+        if periodo is not None:
+            indice = ler_indice_do_arquivo(directory, filename)
+            if indice is not None and not any(periodo(ano, mes) for ano, mes in indice):
+                continue
+
+        colunas_arquivo, valores_arquivo = ler_cubo_do_arquivo(directory, filename)
+        if periodo is not None:
+            colunas_arquivo = recortar_cubo(colunas_arquivo, indice or indexar_cubo(colunas_arquivo), periodo)
+
+        for nome in colunas:
+            colunas[nome].extend(colunas_arquivo[nome])
+        valores_por_ano.append((ano_do_arquivo(filename), valores_arquivo))
+
+    # Se a denominação de um codigo mudou entre os anos, vale a mais recente
+    valores_dimensoes = {}
+    for _, valores_arquivo in sorted(valores_por_ano, key=lambda valores: valores[0]):
+        valores_dimensoes.update(valores_arquivo)
+
+    return Cubo(colunas, valores_dimensoes)
@@ -0,0 +1,123 @@
+import heapq
+import math
+from array import array
+from collections import namedtuple
+from itertools import islice
+
+Resultado = namedtuple('Resultado', ['quantidade', 'media', 'mediana', 'desvio_padrao'])
+
+
+# Estatísticas de uma sequência de valores calculadas em uma única passada: média e variância
+# pelo método de Welford, e a mediana exata a partir dos valores guardados em arrays ordenados.
+# Estatísticas de partes diferentes (arquivos, anos, meses...) podem ser juntadas
+class Estatisticas:
+    def __init__(self):
+        self.quantidade = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.partes = []
+        self.pendentes = array('d')
+
+    def adicionar(self, valor):
+        self.quantidade += 1
+        delta = valor - self.media
+        self.media += delta / self.quantidade
+        self.m2 += delta * (valor - self.media)
+        self.pendentes.append(valor)
+
+    def ordenadas(self):
+        if self.pendentes:
+            self.partes.append(array('d', sorted(self.pendentes)))
+            self.pendentes = array('d')
+        return self.partes
+
+    def juntar(self, outras):
+        # Combina a média e a variância de cada parte (Chan et al.); os valores continuam
+        # nos arrays ordenados de cada parte, que só são intercalados para a mediana
+        for outra in outras:
+            if not outra.quantidade:
+                continue
+
+            quantidade = self.quantidade + outra.quantidade
+            delta = outra.media - self.media
+            self.media += delta * outra.quantidade / quantidade
+            self.m2 += outra.m2 + delta * delta * self.quantidade * outra.quantidade / quantidade
+            self.quantidade = quantidade
+            self.partes.extend(outra.ordenadas())
+        return self
+
+    def mediana(self):
+        if not self.quantidade:
+            return math.nan
+
+        partes = self.ordenadas()
+        meio = (self.quantidade - 1) // 2
+        if len(partes) == 1:
+            valores = partes[0]
+            return valores[meio] if self.quantidade % 2 else (valores[meio] + valores[meio + 1]) / 2
+
+        valores = islice(heapq.merge(*partes), meio, None)
+        primeiro = next(valores)
+        return primeiro if self.quantidade % 2 else (primeiro + next(valores)) / 2
+
+    def desvio_padrao(self):
+        # Desvio padrão amostral (n - 1), como o do pandas
+        if self.quantidade < 2:
+            return math.nan
+        return math.sqrt(self.m2 / (self.quantidade - 1))
+
+    def resultado(self):
+        return Resultado(self.quantidade, self.media if self.quantidade else math.nan, self.mediana(), self.desvio_padrao())
+
+
+# Resumo de um recorte das linhas de uma tabela: as estatísticas de uma coluna de valores e os
+# índices das `top` linhas de maior valor (um heap limitado), tudo na mesma passada
+class Resumo:
+    def __init__(self, top):
+        self.top = top
+        self.estatisticas = Estatisticas()
+        self.maiores = []
+
+    def adicionar(self, indice, valor):
+        self.estatisticas.adicionar(valor)
+
+        # Em empates fica a linha que aparece primeiro
+        item = (valor, -indice)
+        if len(self.maiores) < self.top:
+            heapq.heappush(self.maiores, item)
+        elif item > self.maiores[0]:
+            heapq.heapreplace(self.maiores, item)
+
+    def juntar(self, outros):
+        outros = list(outros)
+        self.estatisticas.juntar(outro.estatisticas for outro in outros)
+        self.maiores = heapq.nlargest(self.top, self.maiores + [item for outro in outros for item in outro.maiores])
+        heapq.heapify(self.maiores)
+        return self
+
+    def indices_maiores(self, quantidade=None):
+        return [-indice for _, indice in heapq.nlargest(self.top if quantidade is None else quantidade, self.maiores)]
+
+
+# Percorre a tabela uma vez e devolve um resumo parcial por chave (ex.: ano, mês e elemento);
+# qualquer recorte formado por chaves inteiras é respondido juntando os parciais
+def resumir(tabela, valor, chaves, top, **condicoes):
+    coluna = tabela[valor]
+    colunas_chave = [tabela[chave] for chave in chaves]
+
+    resumos = {}
+    for indice in tabela.indices(**condicoes):
+        chave = tuple(coluna_chave[indice] for coluna_chave in colunas_chave)
+        resumo = resumos.get(chave)
+        if resumo is None:
+            resumo = resumos[chave] = Resumo(top)
+        resumo.adicionar(indice, coluna[indice])
+
+    # Os parciais ficam com os valores já ordenados: juntá-los depois não altera nenhum deles
+    for resumo in resumos.values():
+        resumo.estatisticas.ordenadas()
+    return resumos
+
+
+def juntar_resumos(resumos, top):
+    return Resumo(top).juntar(resumos)
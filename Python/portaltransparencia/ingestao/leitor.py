@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+
+TAMANHO_BLOCO = 64 * 1024
+
+decoder = json.JSONDecoder()
+
+
+def abrir_arquivo(caminho):
+    # Arquivos .json.gz são descompactados durante a leitura
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, 'rt', encoding='utf-8')
+    return open(caminho, 'r')
+
+
+# Lê o arquivo em blocos e devolve um registro de cada vez, sem carregar o documento inteiro:
+# a memória usada fica limitada ao tamanho do bloco mais o maior registro do arquivo
+def iterar_registros(caminho, tamanho_bloco=TAMANHO_BLOCO):
+    with abrir_arquivo(caminho) as file:
+        buffer = ''
+        inicio = -1
+
+        while inicio < 0:
+            bloco = file.read(tamanho_bloco)
+            if not bloco:
+                return
+            buffer += bloco
+            inicio = buffer.find('"registros"')
+
+        buffer = buffer[inicio + len('"registros"'):]
+        posicao = 0
+        dentro_da_lista = False
+        fim_do_arquivo = False
+
+        while True:
+            while posicao < len(buffer) and buffer[posicao] in ' \t\r\n,:':
+                posicao += 1
+
+            if posicao >= len(buffer):
+                if fim_do_arquivo:
+                    raise ValueError(f"Arquivo {caminho} terminou antes do fim da lista de registros")
+                bloco = file.read(tamanho_bloco)
+                fim_do_arquivo = not bloco
+                buffer = buffer[posicao:] + bloco
+                posicao = 0
+                continue
+
+            if not dentro_da_lista:
+                if buffer[posicao] != '[':
+                    raise ValueError(f"Arquivo {caminho} não contém uma lista de registros")
+                dentro_da_lista = True
+                posicao += 1
+                continue
+
+            if buffer[posicao] == ']':
+                return
+
+            try:
+                registro, posicao = decoder.raw_decode(buffer, posicao)
+            except json.JSONDecodeError:
+                # Registro incompleto: lê mais um bloco e tenta de novo
+                if fim_do_arquivo:
+                    raise
+                bloco = file.read(tamanho_bloco)
+                fim_do_arquivo = not bloco
+                buffer = buffer[posicao:] + bloco
+                posicao = 0
+                continue
+
+            yield registro
+
+
+# Campos que vêm antes da lista de registros ("informacao", "totalRegistros"), sem ler a lista
+def ler_cabecalho(caminho, tamanho_bloco=TAMANHO_BLOCO):
+    with abrir_arquivo(caminho) as file:
+        buffer = ''
+        inicio = -1
+
+        while inicio < 0:
+            bloco = file.read(tamanho_bloco)
+            if not bloco:
+                return {}
+            buffer += bloco
+            inicio = buffer.find('"registros"')
+
+    return json.loads(buffer[:inicio].rstrip().rstrip(',') + '}')
+
+
+def sem_compressao(filename):
+    return filename[:-len('.gz')] if filename.endswith('.gz') else filename
+
+
+def listar_arquivos(directory, tipo, user_year=0):
+    return sorted(filename for filename in os.listdir(directory)
+                  if sem_compressao(filename).endswith('.json' if user_year == 0 else f'{user_year}.json') and tipo in filename.lower())
+
+
+def iterar_arquivos(directory, tipo, user_year=0):
+    for json_file in listar_arquivos(directory, tipo, user_year):
+        yield from iterar_registros(os.path.join(directory, json_file))
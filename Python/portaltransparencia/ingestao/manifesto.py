@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import json
+import os
+
+from ingestao.leitor import TAMANHO_BLOCO, iterar_registros, ler_cabecalho, listar_arquivos, sem_compressao
+
+ARQUIVO_MANIFESTO = 'manifest.json'
+
+
+# O manifesto guarda, para cada arquivo de dados/, de onde e quando ele foi baixado,
+# o hash do conteúdo e a contagem de registros (declarada pela API e a real)
+def ler_manifesto(directory):
+    caminho = os.path.join(directory, ARQUIVO_MANIFESTO)
+    if not os.path.exists(caminho):
+        return {}
+
+    with open(caminho, 'r') as file:
+        return json.load(file)
+
+
+def gravar_manifesto(directory, manifesto):
+    caminho = os.path.join(directory, ARQUIVO_MANIFESTO)
+    temporario = caminho + '.tmp'
+
+    with open(temporario, 'w') as file:
+        json.dump(manifesto, file, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(temporario, caminho)
+
+
+def hash_blocos(blocos):
+    sha256 = hashlib.sha256()
+    for bloco in blocos:
+        sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def hash_arquivo(caminho):
+    # O hash é do JSON descompactado: o mesmo conteúdo tem o mesmo hash em .json e em .json.gz
+    with gzip.open(caminho, 'rb') if caminho.endswith('.gz') else open(caminho, 'rb') as file:
+        return hash_blocos(iter(lambda: file.read(TAMANHO_BLOCO), b''))
+
+
+def entrada_atual(directory, filename, manifesto):
+    # A entrada só vale se o arquivo não mudou desde que ela foi gravada
+    entrada = manifesto.get(filename)
+    if entrada is None or not os.path.exists(os.path.join(directory, filename)):
+        return None
+
+    stat = os.stat(os.path.join(directory, filename))
+    if entrada['bytes'] != stat.st_size or entrada['mtime_ns'] != stat.st_mtime_ns:
+        return None
+    return entrada
+
+
+def registrar_arquivo(manifesto, directory, filename, sha256, total_registros, registros, **origem):
+    stat = os.stat(os.path.join(directory, filename))
+
+    entrada = {
+        'period': origem.get('period') or sem_compressao(filename)[:-len('.json')].split(' - ', 1)[1],
+        'windows': origem.get('windows', []),
+        'fetched_at': origem.get('fetched_at'),
+        'bytes': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+        'totalRegistros': total_registros,
+        'registros': registros,
+    }
+    # Completo quando cada resposta trouxe todos os registros que declarou;
+    # vazio quando o arquivo não tem nenhum registro ("totalRegistros":0)
+    entrada['complete'] = all(window['totalRegistros'] == window['registros'] for window in entrada['windows']) \
+        and total_registros == registros
+    entrada['empty'] = registros == 0
+
+    manifesto[filename] = entrada
+    return entrada
+
+
+def atualizar_manifesto(directory):
+    # Registra os arquivos que ainda não estão no manifesto (ou mudaram fora do webscrapper)
+    # e remove as entradas de arquivos que não existem mais
+    manifesto = ler_manifesto(directory)
+    arquivos = listar_arquivos(directory, ' - ')
+
+    for filename in arquivos:
+        if entrada_atual(directory, filename, manifesto):
+            continue
+
+        caminho = os.path.join(directory, filename)
+        registrar_arquivo(manifesto, directory, filename, hash_arquivo(caminho),
+                          ler_cabecalho(caminho).get('totalRegistros'), sum(1 for _ in iterar_registros(caminho)),
+                          fetched_at=manifesto.get(filename, {}).get('fetched_at'))
+
+    for filename in set(manifesto) - set(arquivos):
+        del manifesto[filename]
+
+    gravar_manifesto(directory, manifesto)
+    return manifesto
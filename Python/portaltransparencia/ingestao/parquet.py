@@ -0,0 +1,124 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingestao.binario import TIPOS_CUBO, TIPOS_DIMENSOES, TIPOS_INDICE, gravar_colunas, possui_colunas, tipos_de
+from ingestao.leitor import listar_arquivos
+from ingestao.cubo import COLUNAS_CUBO, COLUNAS_INDICE, colunas_do_indice, indexar_cubo, montar_cubo
+from ingestao.tabela import COLUNAS_ITENS, achatar_arquivo, caminho_particao, dimensoes_do_arquivo, nova_coluna, particao_atualizada
+
+TIPOS_COLUNAS = {
+    'ano': pa.int16(),
+    'mes': pa.int8(),
+    'tipoMovimento': pa.string(),
+    'valorMovimento': pa.float64(),
+    'emissao': pa.string(),
+    'naturezaDespesa.elemento': pa.string(),
+    'denominacao': pa.string(),
+    'quantidade': pa.float64(),
+    'unidadeMedida': pa.string(),
+    'valorUnitario': pa.float64(),
+    'valorTotal': pa.float64(),
+}
+
+SCHEMA_CUBO = pa.schema([('dimensao', pa.string()), ('valor', pa.string()), ('tipoMovimento', pa.string()),
+                         ('ano', pa.int16()), ('mes', pa.int8()), ('valorMovimento', pa.float64())])
+
+SCHEMA_INDICE = pa.schema([('dimensao', pa.string()), ('ano', pa.int16()), ('mes', pa.int8()),
+                           ('inicio', pa.int64()), ('fim', pa.int64())])
+
+SCHEMA_DIMENSOES = pa.schema([('dimensao', pa.string()), ('codigo', pa.string()), ('denominacao', pa.string())])
+
+
+def schema_de(colunas):
+    # O exercício não é gravado: ele já está no caminho da partição (ano=...).
+    # As colunas de dimensão guardam o codigo da API, como texto
+    return pa.schema([(nome, TIPOS_COLUNAS.get(nome, pa.string())) for nome in colunas if nome != 'exercicio'])
+
+
+def escrever_tabela(destino, nome, colunas, schema):
+    caminho = os.path.join(destino, nome)
+    temporario = caminho + '.tmp'
+
+    tabela = pa.Table.from_pydict({campo.name: colunas[campo.name] for campo in schema}, schema=schema)
+    pq.write_table(tabela, temporario, compression='zstd')
+    os.replace(temporario, caminho)
+
+
+def converter_para_parquet(directory, filename):
+    movimentos, itens, valores_dimensoes = achatar_arquivo(directory, filename)
+    dimensoes_arquivo = dimensoes_do_arquivo(filename)
+
+    destino = caminho_particao(directory, filename)
+    os.makedirs(destino, exist_ok=True)
+
+    dimensoes = {'dimensao': [], 'codigo': [], 'denominacao': []}
+    for (nome, codigo), denominacao in valores_dimensoes.items():
+        dimensoes['dimensao'].append(nome)
+        dimensoes['codigo'].append(codigo)
+        dimensoes['denominacao'].append(denominacao)
+
+    # movimentos.parquet é gravado por último: é ele que marca a partição como atualizada
+    escrever_tabela(destino, 'itens.parquet', itens, schema_de(COLUNAS_ITENS))
+    escrever_tabela(destino, 'dimensoes.parquet', dimensoes, SCHEMA_DIMENSOES)
+    cubo = montar_cubo(movimentos, dimensoes_arquivo)
+    escrever_tabela(destino, 'cubo.parquet', cubo, SCHEMA_CUBO)
+    indice = colunas_do_indice(indexar_cubo(cubo))
+    escrever_tabela(destino, 'indice.parquet', indice, SCHEMA_INDICE)
+
+    # As mesmas tabelas em colunas binárias, que os processos do painel mapeiam em memória
+    gravar_colunas(destino, {
+        'movimentos': (movimentos, tipos_de(movimentos)),
+        'itens': (itens, tipos_de(COLUNAS_ITENS)),
+        'cubo': (cubo, TIPOS_CUBO),
+        'indice': (indice, TIPOS_INDICE),
+        'dimensoes': (dimensoes, TIPOS_DIMENSOES),
+    })
+    escrever_tabela(destino, 'movimentos.parquet', movimentos, schema_de(movimentos))
+
+    print(f"Partição {destino} criada com sucesso.")
+
+
+def particao_completa(directory, filename):
+    # Em dia com o arquivo e com as colunas binárias: partições gravadas antes delas são refeitas
+    return particao_atualizada(directory, filename) and possui_colunas(caminho_particao(directory, filename))
+
+
+def converter_diretorio(directory):
+    # Só os arquivos sem partição completa: anos que o download incremental não baixou de novo,
+    # arquivos que já estavam em dados/ e partições de um layout anterior
+    for filename in listar_arquivos(directory, ' - '):
+        if not particao_completa(directory, filename):
+            converter_para_parquet(directory, filename)
+
+
+def colunas_em_memoria(tabela, exercicio):
+    colunas = {nome: nova_coluna(nome, valores) for nome, valores in tabela.to_pydict().items()}
+    colunas['exercicio'] = nova_coluna('exercicio', valores=[exercicio]) * tabela.num_rows
+    return colunas
+
+
+def ler_particao(caminho, exercicio, colunas=None):
+    colunas_arquivo = None if colunas is None else [nome for nome in colunas if nome != 'exercicio']
+
+    movimentos = colunas_em_memoria(pq.read_table(os.path.join(caminho, 'movimentos.parquet'), columns=colunas_arquivo),
+                                    exercicio)
+    if colunas is not None and 'exercicio' not in colunas:
+        del movimentos['exercicio']
+
+    itens = colunas_em_memoria(pq.read_table(os.path.join(caminho, 'itens.parquet')), exercicio)
+
+    return movimentos, itens
+
+
+def ler_cubo(caminho):
+    return pq.read_table(os.path.join(caminho, 'cubo.parquet'), columns=COLUNAS_CUBO).to_pydict()
+
+
+def ler_indice(caminho):
+    return pq.read_table(os.path.join(caminho, 'indice.parquet'), columns=COLUNAS_INDICE).to_pydict()
+
+
+def ler_dimensoes(caminho):
+    dimensoes = pq.read_table(os.path.join(caminho, 'dimensoes.parquet')).to_pydict()
+    return {(nome, codigo): denominacao for nome, codigo, denominacao in zip(dimensoes['dimensao'], dimensoes['codigo'], dimensoes['denominacao'])}
@@ -0,0 +1,264 @@
+import os
+import sys
+from array import array
+
+from ingestao.leitor import iterar_registros, listar_arquivos, sem_compressao
+from ingestao.manifesto import entrada_atual, ler_manifesto
+
+# Caminhos (dentro de cada registro) das dimensões usadas pelos gráficos
+DIMENSOES_DESPESA = {
+    'naturezaDespesa.categoriaEconomica': ('naturezaDespesa', 'categoriaEconomica'),
+    'naturezaDespesa.elemento': ('naturezaDespesa', 'elemento'),
+    'naturezaDespesa.detalhamento': ('naturezaDespesa', 'detalhamento'),
+    'unidadeOrcamentaria': ('unidadeOrcamentaria',),
+    'despesa.funcao': ('despesa', 'funcao'),
+}
+
+DIMENSOES_RECEITA = {
+    'naturezaReceita.categoriaEconomica': ('naturezaReceita', 'categoriaEconomica'),
+    'naturezaReceita.especie': ('naturezaReceita', 'especie'),
+    'naturezaReceita.alinea': ('naturezaReceita', 'alinea'),
+}
+
+# A versão do formato faz parte do caminho: partições gravadas em um formato antigo são ignoradas
+DIRETORIO_PARQUET = os.path.join('parquet', 'v4')
+
+COLUNAS_MOVIMENTOS = ['exercicio', 'ano', 'mes', 'tipoMovimento', 'valorMovimento']
+
+COLUNAS_ITENS = ['exercicio', 'ano', 'mes', 'emissao', 'naturezaDespesa.elemento', 'denominacao',
+                 'quantidade', 'unidadeMedida', 'valorUnitario', 'valorTotal']
+
+# Tipo (typecode de array.array) das colunas numéricas em memória: cada valor ocupa 2 a 8 bytes
+# dentro do array, em vez de um objeto int/float mais o ponteiro da lista. As colunas de texto,
+# incluindo as de dimensão (o codigo da API), continuam em listas, com os textos internados
+TIPOS_EM_MEMORIA = {
+    'exercicio': 'h',
+    'ano': 'h',
+    'mes': 'b',
+    'valorMovimento': 'd',
+    'quantidade': 'd',
+    'valorUnitario': 'd',
+    'valorTotal': 'd',
+}
+
+# Codigo gravado quando o registro não tem a dimensão; a denominação dele também é None
+SEM_CODIGO = None
+
+
+def nova_coluna(nome, valores=()):
+    if nome in TIPOS_EM_MEMORIA:
+        return array(TIPOS_EM_MEMORIA[nome], valores)
+    # Textos repetidos (tipoMovimento, emissão, unidade...) passam a ser um único objeto
+    return [texto if texto is None else sys.intern(texto) for texto in valores]
+
+
+def novas_colunas(nomes):
+    return {nome: nova_coluna(nome) for nome in nomes}
+
+
+# Tabela colunar simples: um dicionário de colunas (listas, arrays ou colunas mapeadas de uma
+# partição binária), todas do mesmo tamanho
+class Tabela:
+    def __init__(self, colunas):
+        self.colunas = colunas
+
+    def __len__(self):
+        if not self.colunas:
+            return 0
+        return len(next(iter(self.colunas.values())))
+
+    def __getitem__(self, nome):
+        return self.colunas[nome]
+
+    def linhas(self, *nomes):
+        return zip(*(self.colunas[nome] for nome in nomes))
+
+    def indices(self, **condicoes):
+        # Cada condição pode ser um valor, uma coleção de valores aceitos ou uma função
+        testes = []
+        for nome, condicao in condicoes.items():
+            if callable(condicao):
+                testes.append((self.colunas[nome], condicao))
+            elif isinstance(condicao, (set, frozenset, list, tuple)):
+                testes.append((self.colunas[nome], frozenset(condicao).__contains__))
+            else:
+                testes.append((self.colunas[nome], lambda valor, esperado=condicao: valor == esperado))
+
+        return (i for i in range(len(self)) if all(teste(coluna[i]) for coluna, teste in testes))
+
+    def selecionar(self, indices):
+        return Tabela({nome: selecionar(coluna, indices) for nome, coluna in self.colunas.items()})
+
+    def filtrar(self, **condicoes):
+        return self.selecionar(list(self.indices(**condicoes)))
+
+
+def selecionar(coluna, indices):
+    if isinstance(coluna, array):
+        return array(coluna.typecode, (coluna[i] for i in indices))
+    if isinstance(coluna, memoryview):
+        return array(coluna.format, (coluna[i] for i in indices))
+    return [coluna[i] for i in indices]
+
+
+def ano_do_arquivo(filename):
+    return int(sem_compressao(filename)[:-len('.json')].rsplit('-', 1)[1])
+
+
+# Identifica a versão dos arquivos pelo hash do conteúdo registrado no manifesto; arquivos
+# fora do manifesto (ou alterados depois dele) usam o nome, tamanho e data de modificação
+def versao_arquivos(directory, tipo, user_year=0):
+    manifesto = ler_manifesto(directory)
+
+    versao = []
+    for filename in listar_arquivos(directory, tipo, user_year):
+        entrada = entrada_atual(directory, filename, manifesto)
+        if entrada:
+            versao.append((filename, entrada['sha256']))
+        else:
+            stat = os.stat(os.path.join(directory, filename))
+            versao.append((filename, stat.st_size, stat.st_mtime_ns))
+    return tuple(versao)
+
+
+def dimensao(registro, caminho):
+    valor = registro
+    for chave in caminho:
+        valor = valor.get(chave)
+        if valor is None:
+            return None
+    return valor
+
+
+# As dimensões são gravadas pelo codigo da API; a denominação de cada codigo fica no dicionário
+# de dimensões e só é usada na hora de exibir. O codigo é guardado como texto, do jeito que veio:
+# convertê-lo para inteiro falharia com codigos não numéricos e juntaria "01" e "1"
+def codigo_de(valor):
+    return sys.intern(str(valor['codigo']))
+
+
+def achatar_registros(registros, exercicio, dimensoes):
+    movimentos = novas_colunas(COLUNAS_MOVIMENTOS + list(dimensoes))
+    itens = novas_colunas(COLUNAS_ITENS)
+    valores_dimensoes = {}
+    intern = sys.intern
+
+    for registro in registros:
+        registro = registro['registro']
+
+        valores = []
+        for nome, caminho in dimensoes.items():
+            valor = dimensao(registro, caminho)
+            if valor is None:
+                valores.append((movimentos[nome], SEM_CODIGO))
+                valores_dimensoes[(nome, SEM_CODIGO)] = None
+            else:
+                codigo = codigo_de(valor)
+                valores.append((movimentos[nome], codigo))
+                valores_dimensoes[(nome, codigo)] = valor['denominacao']
+
+        for movimento in registro['listMovimentos']:
+            # dataMovimento vem sempre como AAAA-MM-DD
+            data = movimento['dataMovimento']
+            year, month = int(data[:4]), int(data[5:7])
+
+            movimentos['exercicio'].append(exercicio)
+            movimentos['ano'].append(year)
+            movimentos['mes'].append(month)
+            movimentos['tipoMovimento'].append(intern(movimento['tipoMovimento']))
+            movimentos['valorMovimento'].append(movimento['valorMovimento'])
+            for coluna, valor in valores:
+                coluna.append(valor)
+
+        if not registro.get('listEmpenhoItens'):
+            continue
+
+        emissao = intern(registro['empenho']['emissao'])
+        year, month = int(emissao[:4]), int(emissao[5:7])
+        elemento = intern(dimensao(registro, DIMENSOES_DESPESA['naturezaDespesa.elemento'])['denominacao'])
+
+        for empenho_item in registro['listEmpenhoItens']:
+            itens['exercicio'].append(exercicio)
+            itens['ano'].append(year)
+            itens['mes'].append(month)
+            itens['emissao'].append(emissao)
+            itens['naturezaDespesa.elemento'].append(elemento)
+            itens['denominacao'].append(intern(empenho_item['denominacao']))
+            itens['quantidade'].append(empenho_item['quantidade'])
+            itens['unidadeMedida'].append(intern(empenho_item['unidadeMedida']['sigla']))
+            itens['valorUnitario'].append(empenho_item['valorUnitario'])
+            itens['valorTotal'].append(empenho_item['quantidade'] * empenho_item['valorUnitario'])
+
+    return movimentos, itens, valores_dimensoes
+
+
+def dimensoes_do_arquivo(filename):
+    return DIMENSOES_RECEITA if 'receita' in filename.lower() else DIMENSOES_DESPESA
+
+
+def achatar_arquivo(directory, filename):
+    registros = iterar_registros(os.path.join(directory, filename))
+
+    return achatar_registros(registros, ano_do_arquivo(filename), dimensoes_do_arquivo(filename))
+
+
+# Partições colunares geradas após cada download: parquet/v4/tipo=<tipo>/ano=<ano>/
+def caminho_particao(directory, filename):
+    tipo = filename.split(' - ')[0].strip().lower()
+    return os.path.join(directory, DIRETORIO_PARQUET, f'tipo={tipo}', f'ano={ano_do_arquivo(filename)}')
+
+
+def particao_atualizada(directory, filename):
+    caminho = os.path.join(caminho_particao(directory, filename), 'movimentos.parquet')
+    return os.path.exists(caminho) and os.path.getmtime(caminho) >= os.path.getmtime(os.path.join(directory, filename))
+
+
+def leitor_da_particao(caminho):
+    # As colunas binárias (mapeadas em memória, sem decodificação) têm preferência; partições
+    # gravadas antes delas continuam sendo lidas do parquet
+    from ingestao import binario
+    if binario.possui_colunas(caminho):
+        return binario
+
+    from ingestao import parquet
+    return parquet
+
+
+def ler_arquivo(directory, filename, colunas=None):
+    # Usa a partição quando ela estiver em dia com o .json
+    if particao_atualizada(directory, filename):
+        caminho = caminho_particao(directory, filename)
+        return leitor_da_particao(caminho).ler_particao(caminho, ano_do_arquivo(filename), colunas)
+
+    movimentos, itens, _ = achatar_arquivo(directory, filename)
+    if colunas is not None:
+        movimentos = {nome: movimentos[nome] for nome in colunas}
+    return movimentos, itens
+
+
+# Lê cada arquivo uma única vez e achata os registros em duas tabelas:
+# uma linha por movimento e uma linha por item de empenho
+def carregar_tabelas(directory, tipo, user_year=0, colunas=None):
+    dimensoes = DIMENSOES_RECEITA if 'receita' in tipo else DIMENSOES_DESPESA
+    if colunas is None:
+        colunas = COLUNAS_MOVIMENTOS + list(dimensoes)
+
+    # Com um único arquivo as colunas lidas são usadas como estão: numa partição binária elas
+    # continuam mapeadas, sem cópia
+    arquivos = listar_arquivos(directory, tipo, user_year)
+    if len(arquivos) == 1:
+        movimentos, itens = ler_arquivo(directory, arquivos[0], colunas)
+        return Tabela(movimentos), Tabela(itens)
+
+    movimentos = novas_colunas(colunas)
+    itens = novas_colunas(COLUNAS_ITENS)
+
+    for json_file in arquivos:
+        movimentos_arquivo, itens_arquivo = ler_arquivo(directory, json_file, colunas)
+
+        for nome in movimentos:
+            movimentos[nome].extend(movimentos_arquivo[nome])
+        for nome in itens:
+            itens[nome].extend(itens_arquivo[nome])
+
+    return Tabela(movimentos), Tabela(itens)
@@ -1,4 +1,5 @@
 from webscrapper.webscrapper import start_web_scrapping
+from ingestao.banco import atualizar_banco
 from graficos.receitas import receita_acumulada_de_um_ano
 from graficos.despesas import (
     despesa_por_mes_do_ano,
@@ -34,6 +35,7 @@ def main():
         print("5. Consultar despesas acumuladas de todos os anos")
         print("--------------")
         print("6. Baixar arquivos .json do Portal da Transparência")
+        print("7. Criar/atualizar o banco SQLite (consultas passam a usar o banco)")
         print("0. Sair")
 
         choice = input("Escolha uma opção (1/2/3/4): ")
@@ -60,6 +62,8 @@ def main():
             despesa_acumulada_todos_os_anos(tipo_despesa)
         elif choice == "6":
             start_web_scrapping()
+        elif choice == "7":
+            atualizar_banco('dados/')
         elif choice == "0":
             print("Saindo do programa.")
             break
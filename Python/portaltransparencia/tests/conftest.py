@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos são importados a partir de Python/portaltransparencia, como no init.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
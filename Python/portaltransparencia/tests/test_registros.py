@@ -0,0 +1,55 @@
+from webscrapper.utils.registros import MergedRegistros
+
+
+def movimento(data, valor, tipo='Empenho'):
+    return {'dataMovimento': data, 'valorMovimento': valor, 'tipoMovimento': tipo}
+
+
+def empenho(numero, saldo, movimentos):
+    return {'registro': {'exercicio': {'exercicio': 2021}, 'empenho': {'numero': numero},
+                         'saldo': saldo, 'listMovimentos': movimentos}}
+
+
+def fonte(registros):
+    return lambda: iter(registros)
+
+
+def total(registros):
+    return sum(movimento['valorMovimento'] for registro in registros for movimento in registro['registro']['listMovimentos'])
+
+
+def test_junta_arquivo_antigo_com_periodo_baixado_de_novo():
+    antigo = [
+        empenho(1, 100, [movimento('2021-01-10', 100), movimento('2021-03-05', 10)]),
+        empenho(2, 50, [movimento('2021-02-01', 50), movimento('2021-02-01', 50)]),
+    ]
+    novo = [
+        # O saldo mudou e o movimento de março foi corrigido no portal
+        empenho(1, 80, [movimento('2021-03-05', -20)]),
+        empenho(3, 30, [movimento('2021-03-20', 30)]),
+    ]
+    merged = MergedRegistros([(fonte(antigo), ('2021-03', '2021-03')), (fonte(novo), None)])
+
+    assert len(merged) == 3
+    assert merged.source_sizes == [2, 2]
+    assert merged.last_movimento == '2021-03-20'
+
+    registros = {registro['registro']['empenho']['numero']: registro['registro'] for registro in merged}
+    assert registros[1]['saldo'] == 80
+    assert registros[1]['listMovimentos'] == [movimento('2021-01-10', 100), movimento('2021-03-05', -20)]
+    # Movimentos repetidos dentro da mesma fonte são legítimos
+    assert registros[2]['listMovimentos'] == [movimento('2021-02-01', 50), movimento('2021-02-01', 50)]
+    assert total(merged) == 100 - 20 + 100 + 30
+
+
+def test_movimentos_repetidos_entre_fontes_nao_sao_somados_de_novo():
+    primeira = [empenho(1, 100, [movimento('2021-01-10', 100), movimento('2021-01-10', 100)])]
+    segunda = [empenho(1, 100, [movimento('2021-01-10', 100), movimento('2021-02-10', 5)])]
+    merged = MergedRegistros([(fonte(primeira), None), (fonte(segunda), None)])
+
+    assert len(merged) == 1
+    [registro] = list(merged)
+    assert registro['registro']['listMovimentos'] == [movimento('2021-01-10', 100), movimento('2021-01-10', 100),
+                                                      movimento('2021-02-10', 5)]
+    # O resultado pode ser percorrido mais de uma vez
+    assert total(merged) == total(merged) == 205
@@ -0,0 +1,158 @@
+import glob
+import json
+import os
+import shutil
+
+import pytest
+
+from ingestao import binario, parquet
+from ingestao.agregacao import Consulta, agregar_varias
+from ingestao.banco import agregar_banco, atualizar_banco, banco_atualizado, carregar_itens
+from ingestao.cubo import carregar_cubo
+from ingestao.tabela import DIRETORIO_PARQUET, caminho_particao, carregar_tabelas, leitor_da_particao
+
+DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'dados')
+
+RECEITAS = ['receita - 1 a 12 - 2021.json', 'receita - 1 a 12 - 2022.json']
+
+CONSULTAS = {
+    'total': Consulta(),
+    'por_tipo': Consulta(dimensao='tipoMovimento'),
+    'por_ano': Consulta(dimensao='tipoMovimento', grao='ano'),
+    'por_mes': Consulta(dimensao='tipoMovimento', grao='mes', anos=2021, meses=(1, 6)),
+}
+
+CONSULTAS_TIPO = {
+    'despesa': {
+        'por_elemento': Consulta(dimensao='naturezaDespesa.elemento'),
+        'pago_por_funcao': Consulta(dimensao='despesa.funcao', tipos_movimento='Pagamento', ordenar=True),
+        'pago_por_unidade': Consulta(dimensao='unidadeOrcamentaria', tipos_movimento={'Pagamento'}, top=1),
+    },
+    'receita': {
+        'por_especie': Consulta(dimensao='naturezaReceita.especie', tipos_movimento='Arrecadação de receita'),
+        'por_alinea': Consulta(dimensao='naturezaReceita.alinea', anos=(2021, 2022), top=5),
+    },
+}
+
+
+def codigo(valor, denominacao):
+    return {'codigo': valor, 'denominacao': denominacao}
+
+
+def empenho(numero, elemento, funcao, unidade, movimentos, itens=()):
+    registro = {
+        'exercicio': {'exercicio': 2021},
+        'empenho': {'numero': numero, 'emissao': movimentos[0][0]},
+        'naturezaDespesa': {'categoriaEconomica': codigo(3, 'Despesas Correntes'), 'elemento': elemento,
+                            'detalhamento': codigo('33903000', 'Material de Consumo')},
+        'unidadeOrcamentaria': unidade,
+        'listMovimentos': [{'dataMovimento': data, 'tipoMovimento': tipo, 'valorMovimento': valor}
+                           for data, tipo, valor in movimentos],
+        'listEmpenhoItens': [{'denominacao': denominacao, 'quantidade': quantidade,
+                              'unidadeMedida': {'sigla': 'UN'}, 'valorUnitario': valor}
+                             for denominacao, quantidade, valor in itens],
+    }
+    if funcao is not None:
+        registro['despesa'] = {'funcao': funcao}
+    return {'registro': registro}
+
+
+def despesas():
+    # Codigos "01" e "1" são categorias diferentes, um empenho não tem função e um movimento
+    # cai no ano seguinte (restos a pagar)
+    saude, educacao = codigo(10, 'Saúde'), codigo(12, 'Educação')
+    secretaria, prefeitura = codigo('0201', 'Secretaria de Saúde'), codigo('0101', 'Gabinete')
+    return [
+        empenho(1, codigo('01', 'Aposentadorias'), saude, secretaria,
+                [('2021-01-05', 'Empenho', 1000.10), ('2021-02-10', 'Liquidação', 1000.10), ('2021-03-01', 'Pagamento', 900.05)],
+                [('Papel A4', 10, 25.5), ('Caneta', 100, 1.25)]),
+        empenho(2, codigo('1', 'Outro elemento'), educacao, prefeitura,
+                [('2021-06-20', 'Empenho', 300.0), ('2021-06-20', 'Empenho', 300.0), ('2022-01-15', 'Pagamento', 600.0)],
+                [('Merenda', 3, 100.0)]),
+        empenho(3, codigo('30', 'Material de Consumo'), None, prefeitura,
+                [('2021-12-30', 'Empenho', 45.99), ('2021-12-31', 'Anulação de Empenho', -5.99)]),
+    ]
+
+
+@pytest.fixture
+def directory(tmp_path):
+    for filename in RECEITAS:
+        shutil.copy(os.path.join(DADOS, filename), tmp_path / filename)
+
+    conteudo = {'informacao': 'Despesa', 'totalRegistros': 3, 'registros': despesas()}
+    (tmp_path / 'despesa - 1 a 12 - 2021.json').write_text(json.dumps(conteudo, ensure_ascii=False), encoding='utf-8')
+    return str(tmp_path)
+
+
+def soma_dos_arquivos(directory, tipo):
+    total = 0
+    for filename in os.listdir(directory):
+        if filename.startswith(tipo):
+            with open(os.path.join(directory, filename), encoding='utf-8') as arquivo:
+                for registro in json.load(arquivo)['registros']:
+                    total += sum(movimento['valorMovimento'] for movimento in registro['registro']['listMovimentos'])
+    return total
+
+
+def totais(directory, tipo):
+    consultas = {**CONSULTAS, **CONSULTAS_TIPO[tipo]}
+    movimentos, itens = carregar_tabelas(directory, tipo)
+    return {
+        'movimentos': sum(movimentos['valorMovimento']),
+        'itens': sum(itens['valorTotal']),
+        **agregar_varias(carregar_cubo(directory, tipo), consultas),
+    }
+
+
+def totais_do_banco(directory, tipo):
+    consultas = {**CONSULTAS, **CONSULTAS_TIPO[tipo]}
+    return {
+        'itens': sum(carregar_itens(directory, tipo)['valorTotal']),
+        **agregar_banco(directory, tipo, consultas),
+    }
+
+
+def comparar(resultado, esperado):
+    if isinstance(esperado, dict):
+        assert list(resultado) == list(esperado)
+        for chave, valor in esperado.items():
+            comparar(resultado[chave], valor)
+    else:
+        assert resultado == pytest.approx(esperado)
+
+
+def leitores(directory):
+    return {leitor_da_particao(caminho).__name__ for caminho in glob.glob(os.path.join(directory, DIRETORIO_PARQUET, '*', '*'))}
+
+
+@pytest.mark.parametrize('tipo', ['despesa', 'receita'])
+def test_totais_iguais_no_json_nas_particoes_e_no_banco(directory, tipo):
+    pelo_json = totais(directory, tipo)
+    assert pelo_json['movimentos'] == pytest.approx(soma_dos_arquivos(directory, tipo))
+    assert pelo_json['total'] == {None: pytest.approx(pelo_json['movimentos'])}
+
+    parquet.converter_diretorio(directory)
+    assert leitores(directory) == {binario.__name__}
+    comparar(totais(directory, tipo), pelo_json)
+
+    # Sem as colunas binárias a mesma partição é lida do parquet
+    for caminho in glob.glob(os.path.join(directory, DIRETORIO_PARQUET, '*', '*')):
+        shutil.rmtree(os.path.join(caminho, binario.DIRETORIO_BINARIO))
+    assert leitores(directory) == {parquet.__name__}
+    comparar(totais(directory, tipo), pelo_json)
+
+    atualizar_banco(directory)
+    assert banco_atualizado(directory, tipo)
+    pelo_banco = totais_do_banco(directory, tipo)
+    comparar(pelo_banco, {nome: valor for nome, valor in pelo_json.items() if nome != 'movimentos'})
+
+
+def test_codigos_com_zeros_a_esquerda_continuam_separados(directory):
+    esperado = {'Aposentadorias': 1000.10 + 1000.10 + 900.05, 'Outro elemento': 1200.0, 'Material de Consumo': 40.0}
+    consulta = {'por_elemento': CONSULTAS_TIPO['despesa']['por_elemento']}
+
+    comparar(agregar_varias(carregar_cubo(directory, 'despesa'), consulta)['por_elemento'], esperado)
+
+    parquet.converter_diretorio(directory)
+    atualizar_banco(directory)
+    comparar(agregar_banco(directory, 'despesa', consulta)['por_elemento'], esperado)
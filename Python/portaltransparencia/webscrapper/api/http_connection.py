@@ -1,27 +1,147 @@
+import gzip
+import json
 import os
+import random
+import tempfile
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "https://transparencia.e-publica.net/epublica-portal/rest/assu/api/v1/"
+CONNECT_TIMEOUT = 10
+TIMEOUT = 60
+MAX_RESPONSE_BYTES = 20 * 1024 * 1024
+POOL_SIZE = 10
+MAX_RETRIES = 4
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
 
-def save_to_json_file(url, file_name):
-    file_name = file_name.replace("/", "")
-    file_name = "dados/" + file_name
+session = None
+session_lock = threading.Lock()
+
+class ResponseTooLarge(Exception):
+    pass
+
+class ResponseTooSlow(Exception):
+    pass
+
+def get_session():
+    # Uma única sessão para todas as threads: as conexões ficam abertas (keep-alive)
+    # e são reaproveitadas, evitando um novo handshake TCP/TLS a cada requisição
+    global session
+
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+    return session
+
+def is_retryable(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, requests.ConnectionError)
 
-    directory = os.path.dirname(file_name)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-        
-    try:
-        response = requests.get(url)
+def download_json(url, file_name, rate_limiter=None, timeout=TIMEOUT, max_bytes=MAX_RESPONSE_BYTES, max_retries=MAX_RETRIES):
+    # Erros 5xx e de conexão são repetidos com espera exponencial e aleatória (jitter);
+    # respostas lentas ou grandes demais sobem para quem chamou dividir a janela
+    for attempt in range(max_retries + 1):
+        try:
+            return download_json_once(url, file_name, rate_limiter, timeout, max_bytes)
+        except requests.RequestException as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            print(f"Tentativa {attempt + 1} de {url} falhou ({e}), tentando de novo em {delay:.1f}s")
+            time.sleep(delay)
+
+def download_json_once(url, file_name, rate_limiter, timeout, max_bytes):
+    if rate_limiter:
+        rate_limiter.wait(url)
+
+    start = time.monotonic()
+
+    with get_session().get(url, timeout=(CONNECT_TIMEOUT, timeout), stream=True) as response:
         response.raise_for_status()
 
-        with open(file_name, "w") as file:
-            file.write(response.text)
+        content_length = int(response.headers.get("Content-Length") or 0)
+        if content_length > max_bytes:
+            raise ResponseTooLarge(f"Resposta de {content_length} bytes excede o limite de {max_bytes} bytes")
+
+        # A resposta vai direto para o disco em blocos, compactada, sem ficar inteira na memória
+        with atomic_gzip_file(file_name) as file:
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                file.write(chunk)
+                size += len(chunk)
+
+                if size > max_bytes:
+                    raise ResponseTooLarge(f"Resposta excede o limite de {max_bytes} bytes")
+                if time.monotonic() - start > timeout:
+                    raise ResponseTooSlow(f"Resposta demorou mais de {timeout} segundos")
+
+        transferred = response.raw.tell()
+
+    print(f"{url}: {time.monotonic() - start:.2f}s, {transferred} bytes transferidos, {size} bytes descompactados")
+
+    return file_name
+
+class atomic_gzip_file:
+    # Escreve em um arquivo temporário no mesmo diretório e só o renomeia para o nome final
+    # (operação atômica) quando a escrita termina sem erro: um arquivo pela metade nunca
+    # aparece no lugar do arquivo final
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def __enter__(self):
+        directory = os.path.dirname(self.file_name) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        descriptor, self.temp_name = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        self.raw = os.fdopen(descriptor, "wb")
+        self.file = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        return self.file
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.file.close()
+            self.raw.flush()
+            os.fsync(self.raw.fileno())
+        finally:
+            self.raw.close()
+
+        if exc_type is None:
+            os.replace(self.temp_name, self.file_name)
+        else:
+            os.remove(self.temp_name)
+
+def json_chunks(informacao, registros):
+    # O arquivo é gerado registro a registro, sem montar o documento inteiro na memória
+    header = json.dumps({"informacao": informacao, "totalRegistros": len(registros)}, ensure_ascii=False)
+    yield f'{header[:-1]},"registros":['.encode()
+
+    for index, registro in enumerate(registros):
+        if index:
+            yield b","
+        yield json.dumps(registro, ensure_ascii=False, separators=(",", ":")).encode()
+
+    yield b"]}"
+
+def save_json_file(informacao, registros, file_name):
+    file_name = file_name.replace("/", "")
+    file_name = "dados/" + file_name
+
+    with atomic_gzip_file(file_name) as file:
+        for chunk in json_chunks(informacao, registros):
+            file.write(chunk)
 
-        print(f"Arquivo {file_name} criado com sucesso.")
-    except Exception as e:
-        print(f"Falha ao criar o arquivo {file_name}")
-        print(e)
+    print(f"Arquivo {file_name} criado com sucesso.")
+    return file_name
 
 def get_api_url(tipo, period_start, period_end):
     period_start_str = period_start.strftime("%m/%Y")
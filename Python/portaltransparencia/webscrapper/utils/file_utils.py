@@ -1,2 +1,2 @@
 def get_file_name(tipo, period):
-    return f"{tipo} - {period}.json"
+    return f"{tipo} - {period}.json.gz"
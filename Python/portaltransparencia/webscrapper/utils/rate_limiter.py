@@ -0,0 +1,21 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+# Espaça as requisições feitas a um mesmo host, mesmo quando várias threads baixam ao mesmo tempo
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.next_request = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlparse(url).netloc
+
+        with self.lock:
+            now = time.monotonic()
+            scheduled = max(now, self.next_request.get(host, now))
+            self.next_request[host] = scheduled + self.interval
+
+        if scheduled > now:
+            time.sleep(scheduled - now)
@@ -0,0 +1,96 @@
+import json
+from collections import Counter
+
+def registro_key(registro):
+    # Identifica o registro pelo identificador do portal, que não muda quando outros campos
+    # (situação, saldo, denominações...) são alterados: número do empenho e exercício na
+    # despesa, código da receita na receita. Sem eles, vale o conteúdo sem os movimentos
+    registro = registro['registro']
+
+    numero = (registro.get('empenho') or {}).get('numero')
+    if numero is not None:
+        return ('empenho', (registro.get('exercicio') or {}).get('exercicio'), numero)
+
+    codigo = (registro.get('receita') or {}).get('codigo')
+    if codigo is not None:
+        return ('receita', codigo)
+
+    registro = dict(registro)
+    registro.pop('listMovimentos', None)
+    return json.dumps(registro, sort_keys=True, ensure_ascii=False)
+
+def movimento_key(movimento):
+    return json.dumps(movimento, sort_keys=True, ensure_ascii=False)
+
+class MergedRegistros:
+    # Junta os registros de várias fontes sem montar a lista inteira na memória. `sources` é uma
+    # lista de (abrir, periodo), da mais antiga para a mais nova: abrir() devolve um iterador de
+    # registros e pode ser chamado mais de uma vez. Cada fonte com `periodo` ('AAAA-MM', 'AAAA-MM')
+    # é um arquivo antigo, cujos movimentos nesse período foram baixados de novo e são descartados.
+    # De um registro que aparece em várias fontes ficam os campos da fonte mais nova; um movimento
+    # repetido dentro da mesma fonte é legítimo, mas entre fontes é duplicado, então fica a maior
+    # quantidade vista em uma fonte. Só os registros que aparecem em mais de uma fonte (a
+    # sobreposição) ficam na memória; os demais são lidos de novo a cada vez que o resultado é
+    # percorrido, na ordem em que aparecem pela primeira vez
+    def __init__(self, sources):
+        self.sources = sources
+        self.source_sizes = []
+        self.last_movimento = None
+
+        counts = Counter()
+        for open_source, periodo in sources:
+            size = 0
+            for registro in open_source():
+                size += 1
+                counts[registro_key(registro)] += 1
+                for movimento in self.movimentos(registro, periodo):
+                    if self.last_movimento is None or movimento['dataMovimento'] > self.last_movimento:
+                        self.last_movimento = movimento['dataMovimento']
+            self.source_sizes.append(size)
+
+        self.total = len(counts)
+
+        self.merged = {}
+        for open_source, periodo in sources:
+            for registro in open_source():
+                key = registro_key(registro)
+                if counts[key] > 1:
+                    _, movimentos = self.merged.get(key, (None, Counter()))
+                    self.merged[key] = (registro, self.add_movimentos(movimentos, registro, periodo))
+
+    @staticmethod
+    def movimentos(registro, periodo):
+        movimentos = registro['registro']['listMovimentos']
+        if periodo is None:
+            return movimentos
+        inicio, fim = periodo
+        return [movimento for movimento in movimentos if not inicio <= movimento['dataMovimento'][:7] <= fim]
+
+    def add_movimentos(self, movimentos, registro, periodo):
+        counts = Counter(movimento_key(movimento) for movimento in self.movimentos(registro, periodo))
+        for movimento_k, count in counts.items():
+            movimentos[movimento_k] = max(movimentos[movimento_k], count)
+        return movimentos
+
+    @staticmethod
+    def with_movimentos(registro, movimentos):
+        list_movimentos = sorted((json.loads(movimento_k) for movimento_k, count in movimentos.items() for _ in range(count)),
+                                 key=lambda movimento: movimento['dataMovimento'])
+        return dict(registro, registro=dict(registro['registro'], listMovimentos=list_movimentos))
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        seen = set()
+        for open_source, periodo in self.sources:
+            for registro in open_source():
+                key = registro_key(registro)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                if key in self.merged:
+                    yield self.with_movimentos(*self.merged[key])
+                else:
+                    yield self.with_movimentos(registro, self.add_movimentos(Counter(), registro, periodo))
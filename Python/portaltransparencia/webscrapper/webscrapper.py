@@ -1,28 +1,235 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime, timedelta
-from webscrapper.api.http_connection import save_to_json_file, get_api_url
+from webscrapper.api.http_connection import download_json, json_chunks, save_json_file, get_api_url
 from webscrapper.utils.file_utils import get_file_name
+from webscrapper.utils.rate_limiter import RateLimiter
+from webscrapper.utils.registros import MergedRegistros
+from ingestao.banco import atualizar_banco, caminho_banco
+from ingestao.leitor import iterar_registros, ler_cabecalho
+from ingestao.manifesto import atualizar_manifesto, entrada_atual, gravar_manifesto, hash_blocos, ler_manifesto, registrar_arquivo
+from ingestao.parquet import converter_diretorio, converter_para_parquet, particao_completa
+import json
+import os
 
 TYPES = ["receita", "despesa"]
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 2
+WINDOW_MONTHS = 3
+# Pagamentos e cancelamentos de restos a pagar entram nos arquivos dos exercícios anteriores,
+# com datas posteriores: anos de despesa encerrados continuam sendo baixados por este número de anos
+DESPESA_LOOKBACK_YEARS = 2
+DATA_DIRECTORY = "dados/"
+STATE_FILE = "dados/scraping_state.json"
 
-def start_web_scrapping():
-    for tipo in TYPES:
-        start = datetime(datetime.now().year - 5, 1, 1)
-        end = datetime.now()
+class YearDownload:
+    def __init__(self, tipo, period_start, period_end):
+        self.tipo = tipo
+        self.period = f"{period_start.month} a {period_end.month} - {period_start.year}"
+        self.file_name = get_file_name(tipo, self.period)
+        self.year = period_start.year
+        self.existing_file = None
+        # Meses ('AAAA-MM', 'AAAA-MM') baixados de novo no modo incremental
+        self.refetched = None
+        self.pending = 0
+        self.responses = []
+        self.error = None
 
-        while start < end:
-            period_start = start
-            period_end = start + timedelta(days=364) #365 - 1
+def get_periods():
+    start = datetime(datetime.now().year - 5, 1, 1)
+    end = datetime.now()
 
-            if period_end > end:
-                period_end = end
+    while start < end:
+        period_start = start
+        period_end = start + timedelta(days=364) #365 - 1
 
-            period = f"{period_start.month} a {period_end.month} - {period_start.year}"
-            file_name = get_file_name(tipo, period)
+        if period_end > end:
+            period_end = end
 
-            api_url = get_api_url(tipo, period_start, period_end)
+        yield period_start, period_end
 
-            print(f"inicio: {period_start}\nfim: {period_end}\n{api_url}")
+        start = datetime(period_start.year + 1, 1, 1)
 
-            save_to_json_file(api_url, file_name)
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
 
-            start = datetime(period_start.year + 1, 1, 1)
+    with open(STATE_FILE, "r") as file:
+        return json.load(file)
+
+def save_state(state):
+    with open(STATE_FILE, "w") as file:
+        json.dump(state, file, indent=2)
+
+def find_existing_files(tipo, year):
+    # Arquivos do mesmo tipo e ano, do mais recente para o mais antigo (.json antigos ou .json.gz)
+    if not os.path.exists(DATA_DIRECTORY):
+        return []
+
+    files = [os.path.join(DATA_DIRECTORY, file_name) for file_name in os.listdir(DATA_DIRECTORY)
+             if file_name.startswith(f"{tipo} - ") and file_name.endswith((f" - {year}.json", f" - {year}.json.gz"))]
+
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+def split_window(window_start, window_end, months):
+    # Divide [window_start, window_end] (mesmo ano) em janelas de até `months` meses
+    windows = []
+    month = window_start.month
+
+    while month <= window_end.month:
+        last_month = min(month + months - 1, window_end.month)
+        windows.append((datetime(window_start.year, month, 1), datetime(window_start.year, last_month, 1)))
+        month = last_month + 1
+
+    return windows
+
+def fetch_window(tipo, window_start, window_end, rate_limiter):
+    api_url = get_api_url(tipo, window_start, window_end)
+
+    print(f"inicio: {window_start}\nfim: {window_end}\n{api_url}")
+
+    period = f"{window_start.month} a {window_end.month} - {window_start.year}"
+    window_file = os.path.join(DATA_DIRECTORY, f".{tipo} - {period}.part.gz")
+
+    download_json(api_url, window_file, rate_limiter)
+
+    return {"file": window_file, "url": api_url, "period": period,
+            "totalRegistros": ler_cabecalho(window_file).get("totalRegistros"), "registros": 0}
+
+def finish_download(download, state, manifest):
+    windows = [window for _, window in sorted(download.responses, key=lambda response: response[0])]
+
+    try:
+        if download.error:
+            print(f"Falha ao criar o arquivo {download.file_name}")
+            print(download.error)
+            return
+
+        sources = [(lambda file=window["file"]: iterar_registros(file), None) for window in windows]
+
+        # No modo incremental os meses baixados de novo são mesclados ao arquivo já existente;
+        # os movimentos desses meses que estavam no arquivo são substituídos pelos baixados
+        if download.existing_file:
+            sources.insert(0, (lambda: iterar_registros(download.existing_file), download.refetched))
+
+        registros = MergedRegistros(sources)
+        for window, size in zip(windows, registros.source_sizes[-len(windows):] if windows else []):
+            window["registros"] = size
+
+        # Uma resposta incompleta ou sem "registros" (totalRegistros None) faz o ano falhar: o arquivo,
+        # o manifesto e o estado anteriores ficam como estão, e os meses que faltaram são pedidos de
+        # novo na próxima execução
+        incompletas = [window for window in windows if window["totalRegistros"] != window["registros"]]
+        for window in incompletas:
+            print(f"Resposta incompleta em {window['url']}: totalRegistros {window['totalRegistros']}, "
+                  f"{window['registros']} registros recebidos")
+        if incompletas:
+            print(f"Falha ao criar o arquivo {download.file_name}: mantendo o arquivo atual")
+            return
+
+        # Um download com o mesmo conteúdo do arquivo atual não reescreve o arquivo
+        # nem a partição parquet
+        informacao = download.tipo.capitalize()
+        sha256 = hash_blocos(json_chunks(informacao, registros))
+        entry = entrada_atual(DATA_DIRECTORY, download.file_name, manifest)
+
+        if entry and entry["sha256"] == sha256:
+            print(f"Arquivo {download.file_name} não mudou, mantendo o arquivo atual.")
+        else:
+            save_json_file(informacao, registros, download.file_name)
+    finally:
+        for window in windows:
+            os.remove(window.pop("file"))
+
+    for existing_file in find_existing_files(download.tipo, download.year):
+        if os.path.basename(existing_file) != download.file_name:
+            os.remove(existing_file)
+            manifest.pop(os.path.basename(existing_file), None)
+
+    if not particao_completa(DATA_DIRECTORY, download.file_name):
+        converter_para_parquet(DATA_DIRECTORY, download.file_name)
+
+    registrar_arquivo(manifest, DATA_DIRECTORY, download.file_name, sha256, len(registros), len(registros),
+                      period=download.period, windows=windows, fetched_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    gravar_manifesto(DATA_DIRECTORY, manifest)
+
+    state.setdefault(download.tipo, {})[str(download.year)] = {
+        "last_movimento": registros.last_movimento,
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_state(state)
+
+def start_web_scrapping(max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND, window_months=WINDOW_MONTHS,
+                        incremental=True, refresh_years=(), despesa_lookback_years=DESPESA_LOOKBACK_YEARS):
+    # Cada ano é dividido em janelas de window_months meses, baixadas em paralelo
+    # (limitadas por max_workers e requests_per_second). Uma janela que falha, demora
+    # demais ou é grande demais é dividida ao meio e baixada de novo.
+    # No modo incremental os anos encerrados já baixados não são baixados de novo (a não ser
+    # que estejam em refresh_years ou, na despesa, dentro de despesa_lookback_years) e, no ano
+    # corrente, só os meses a partir do último movimento conhecido são pedidos à API
+    rate_limiter = RateLimiter(requests_per_second)
+    state = load_state()
+    manifest = ler_manifesto(DATA_DIRECTORY)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(download, window_start, window_end):
+            future = executor.submit(fetch_window, download.tipo, window_start, window_end, rate_limiter)
+            pending[future] = (download, window_start, window_end)
+            download.pending += 1
+
+        for tipo in TYPES:
+            for period_start, period_end in get_periods():
+                download = YearDownload(tipo, period_start, period_end)
+                year_state = state.get(tipo, {}).get(str(download.year))
+                existing_files = find_existing_files(tipo, download.year)
+
+                if incremental and year_state and existing_files and download.year not in refresh_years:
+                    # Um ano de receita baixado depois de encerrado não muda mais; um de despesa
+                    # ainda recebe restos a pagar durante despesa_lookback_years
+                    closed = year_state["updated_at"] >= f"{download.year + 1}-01-01"
+                    if closed and (tipo != "despesa" or download.year < datetime.now().year - despesa_lookback_years):
+                        print(f"Arquivo {existing_files[0]} já está completo, ignorando.")
+                        continue
+
+                    # Num ano encerrado os restos a pagar podem entrar em qualquer registro: o ano
+                    # inteiro é baixado de novo e mesclado ao arquivo
+                    last_movimento = year_state["last_movimento"]
+                    if not closed and last_movimento and last_movimento.startswith(f"{download.year}-"):
+                        period_start = datetime.strptime(last_movimento, "%Y-%m-%d").replace(day=1)
+                    download.existing_file = existing_files[0]
+                    download.refetched = (period_start.strftime("%Y-%m"), period_end.strftime("%Y-%m"))
+
+                for window_start, window_end in split_window(period_start, period_end, window_months):
+                    submit(download, window_start, window_end)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                download, window_start, window_end = pending.pop(future)
+                download.pending -= 1
+
+                try:
+                    download.responses.append((window_start, future.result()))
+                except Exception as e:
+                    months = window_end.month - window_start.month + 1
+
+                    if months > 1 and not download.error:
+                        print(f"Dividindo a janela {window_start.month} a {window_end.month} - {window_start.year}: {e}")
+                        for sub_start, sub_end in split_window(window_start, window_end, (months + 1) // 2):
+                            submit(download, sub_start, sub_end)
+                    else:
+                        download.error = e
+
+                if download.pending == 0:
+                    finish_download(download, state, manifest)
+
+    # Arquivos que não passaram por este download (anos ignorados, arquivos antigos) também entram no manifesto
+    # e ganham a partição que ainda não têm (ou que está desatualizada)
+    if os.path.exists(DATA_DIRECTORY):
+        atualizar_manifesto(DATA_DIRECTORY)
+        converter_diretorio(DATA_DIRECTORY)
+
+    # O banco SQLite é opcional: só é atualizado se já tiver sido criado
+    if os.path.exists(caminho_banco(DATA_DIRECTORY)):
+        atualizar_banco(DATA_DIRECTORY)
@@ -1,9 +1,11 @@
-import json
 import os
+import sys
 
-directory = '/home/gabriel/Área de Trabalho/TCC_Gabriel/Python/'
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portaltransparencia'))
+
+from ingestao.leitor import iterar_arquivos
 
-json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json') and 'despesa ' in filename.lower()]
+directory = '/home/gabriel/Área de Trabalho/TCC_Gabriel/Python/'
 
 user_year = int(input("Digite o ano desejado: "))
 user_month = int(input("Digite o mês desejado (1 para Janeiro, 2 para Fevereiro, etc.): "))
@@ -11,19 +13,16 @@ user_month = int(input("Digite o mês desejado (1 para Janeiro, 2 para Fevereiro
 # Criar um conjunto para armazenar os tipos de movimento únicos
 tipos_movimento = set()
 
-for json_file in json_files:
-    with open(os.path.join(directory, json_file), 'r') as file:
-        data = json.load(file)
-        for registro in data['registros']:
-            for movimento in registro['registro']['listMovimentos']:
-                if 'pagamento' in movimento['tipoMovimento'].lower():
-                    date = movimento['dataMovimento']
-                    year = int(date.split('-')[0])
-                    month = int(date.split('-')[1])
-                    
-                    if year == user_year and month == user_month:
-                        tipo_movimento = movimento['tipoMovimento']
-                        tipos_movimento.add(tipo_movimento)
+for registro in iterar_arquivos(directory, 'despesa '):
+    for movimento in registro['registro']['listMovimentos']:
+        if 'pagamento' in movimento['tipoMovimento'].lower():
+            date = movimento['dataMovimento']
+            year = int(date.split('-')[0])
+            month = int(date.split('-')[1])
+            
+            if year == user_year and month == user_month:
+                tipo_movimento = movimento['tipoMovimento']
+                tipos_movimento.add(tipo_movimento)
 
 # Exibir os tipos de movimento únicos
 print("Tipos de Movimento Únicos:")
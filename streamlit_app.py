@@ -1,18 +1,39 @@
 import locale
 import streamlit as st
 import os
-import json
+import sys
+import threading
+import time
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import datetime
 from enum import Enum
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Python', 'portaltransparencia'))
+
+from ingestao.agregacao import Consulta, agregar_varias, arredondar_valores, manter_maiores_no_total, teste_de_periodo
+from ingestao.armazem import armazem
+from ingestao.banco import agregar_banco, banco_atualizado, carregar_itens
+from ingestao.cache_disco import obter_em_disco, resumo_de
+from ingestao.cubo import carregar_cubo
+from ingestao.estatisticas import juntar_resumos, resumir
+from ingestao.tabela import Tabela, carregar_tabelas, versao_arquivos
+
 class TiposDeDados(Enum):
     DESPESA = "despesa -"
     RECEITA = "receita -"
 
 directory = 'dados/'
-despesa_categories = set()
+# Tipos de movimento usados nas consultas do painel
+ARRECADACAO = frozenset({'Arrecadação de receita'})
+PAGAMENTOS = frozenset({'Pagamento de empenho', 'Pagamento de restos a pagar'})
+ROTULOS_EXECUCAO = {
+    'Emissão de empenho': 'Empenhado',
+    'Liquidação de empenho': 'Liquidado',
+    'Pagamento de empenho': 'Pago',
+}
 custom_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#e68728', '#0c5922', '#dd4477', '#6633cc', '#5981d3', '#334278']
 
 
@@ -38,109 +59,130 @@ def format_legend_label(label, max_line_length=50):
     
 def formatar_moeda(valor):
     return locale.currency(valor, grouping=True)
-    
-def categorias_economicas_receita(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.RECEITA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Arrecadação de receita' == movimento['tipoMovimento']):
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['naturezaReceita']['categoriaEconomica']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-    df = pd.DataFrame(list(values_by_category.items()), columns=['Categoria', 'Valor'])
-    df['Valor Formatado'] = df['Valor'].apply(formatar_moeda)
-    fig = px.bar(df, x='Valor', y='Categoria', orientation='h', text='Valor Formatado')
-    fig.update_traces(marker_color=custom_colors)
-
-    st.plotly_chart(fig, use_container_width=True)
-
-
-def receitas_por_especie(user_year):
-    categories = set()
-    values_by_category = {}
 
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.RECEITA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Arrecadação de receita' == movimento['tipoMovimento']):
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['naturezaReceita']['especie']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    top_categories = sorted_categories[:5]
-    other_categories = sorted_categories[5:]
+def versao_dados(tipo_de_dados: TiposDeDados, user_year: int = 0):
+    return versao_arquivos(directory, tipo_de_dados.value, user_year)
+
+# Os dados carregados ficam no armazém do processo, compartilhado por todas as sessões: cada
+# conjunto é carregado uma vez e trocado por inteiro quando a versão dos arquivos muda
+# (dados reescritos pelo webscrapper). Os resultados das consultas ficam nos caches do
+# Streamlit e no cache em disco, com a versão na chave.
+# Os movimentos são consultados pelo cubo pré-agregado (ou pelo banco SQLite, quando ele
+# existe e está em dia); das tabelas só os itens de empenho são usados
+def carregar_dados_em_cache(tipo: str, user_year: int, versao: tuple):
+    def carregar():
+        if banco_atualizado(directory, tipo, user_year):
+            return Tabela({}), carregar_itens(directory, tipo, user_year)
+        return carregar_tabelas(directory, tipo, user_year, colunas=[])
+
+    return armazem.obter(('tabelas', tipo, user_year), versao, carregar)
+
+# O cubo de um ano junta os movimentos com data naquele ano de todos os arquivos do tipo
+# (pagamentos de restos a pagar ficam nos arquivos de exercícios anteriores)
+def carregar_cubo_em_cache(tipo: str, user_year: int, versao: tuple):
+    return armazem.obter(('cubo', tipo, user_year), versao,
+                         lambda: carregar_cubo(directory, tipo, periodo=teste_de_periodo(user_year or None, None)))
+
+def chave_da_consulta(consulta: Consulta):
+    # As funções da consulta entram na chave pelo nome: elas são recriadas a cada reexecução do script.
+    # Conjuntos entram ordenados: a ordem do repr deles muda de um processo para outro (PYTHONHASHSEED)
+    # e a chave também é usada no caminho do cache em disco
+    return tuple(campo.__qualname__ if callable(campo) else tuple(sorted(campo)) if isinstance(campo, (set, frozenset)) else campo
+                 for campo in consulta)
+
+def restos_a_pagar(tipo_movimento):
+    return tipo_movimento == 'Pagamento de restos a pagar' or 'Cancelamento de restos a pagar' in tipo_movimento
+
+def rotulo_restos_a_pagar(tipo_movimento):
+    return 'Valor pago' if tipo_movimento == 'Pagamento de restos a pagar' else 'Valor cancelado'
+
+# Agregações de cada seção da página; o nome de cada uma é o da função que a exibe
+def consultas_da_pagina(tipo_de_dados: TiposDeDados, user_year: int):
+    if tipo_de_dados == TiposDeDados.DESPESA:
+        return {
+            'execucao_despesas': Consulta(dimensao='tipoMovimento', tipos_movimento=ROTULOS_EXECUCAO, anos=user_year or None,
+                                          rotulo=ROTULOS_EXECUCAO, ordenar=True),
+            'categorias_economicas': Consulta(dimensao='naturezaDespesa.categoriaEconomica', tipos_movimento=PAGAMENTOS, anos=user_year or None,
+                                              ordenar=True),
+            'execucao_restos_a_pagar': Consulta(dimensao='tipoMovimento', tipos_movimento=restos_a_pagar, anos=user_year or None,
+                                                rotulo=rotulo_restos_a_pagar, ordenar=True),
+            'despesa_12meses': Consulta(dimensao='naturezaDespesa.elemento', tipos_movimento=PAGAMENTOS, grao='mes', anos=user_year),
+            'despesas_por_area': Consulta(dimensao='despesa.funcao', tipos_movimento=PAGAMENTOS, anos=user_year or None, top=5),
+            'despesas_por_elemento': Consulta(dimensao='naturezaDespesa.elemento', tipos_movimento=PAGAMENTOS, anos=user_year or None, top=10),
+            'despesas_por_secretaria': Consulta(dimensao='unidadeOrcamentaria', tipos_movimento=PAGAMENTOS, anos=user_year or None, top=5),
+        }
+
+    return {
+        'receita_12meses': Consulta(dimensao='naturezaReceita.especie', tipos_movimento=ARRECADACAO, grao='mes', anos=user_year),
+        'receitas_por_especie': Consulta(dimensao='naturezaReceita.especie', tipos_movimento=ARRECADACAO, anos=user_year or None, top=5),
+        'categorias_economicas_receita': Consulta(dimensao='naturezaReceita.categoriaEconomica', tipos_movimento=ARRECADACAO,
+                                                  anos=user_year or None),
+    }
+
+# Todas as seções da página são calculadas juntas, em uma única passada pelo cubo. O resultado
+# também fica no cache em disco, pela versão dos dados e pelas consultas
+@st.cache_data(max_entries=64, show_spinner=False, hash_funcs={Consulta: chave_da_consulta})
+def agregar_pagina_em_cache(tipo: str, user_year: int, versao: tuple, consultas: dict):
+    def agregar():
+        if banco_atualizado(directory, tipo):
+            return agregar_banco(directory, tipo, consultas)
+        return agregar_varias(carregar_cubo_em_cache(tipo, user_year, versao), consultas)
+
+    chave_consultas = tuple((nome, chave_da_consulta(consulta)) for nome, consulta in consultas.items())
+    return obter_em_disco(directory, ('pagina', tipo, user_year, versao, chave_consultas), agregar)
+
+def agregar_pagina(tipo_de_dados: TiposDeDados, user_year: int):
+    return agregar_pagina_em_cache(tipo_de_dados.value, user_year, versao_dados(tipo_de_dados),
+                                   consultas_da_pagina(tipo_de_dados, user_year))
+
+# As figuras ficam em cache já convertidas para JSON: na memória do processo e em disco, onde
+# sobrevivem a reinícios. A chave é o gráfico, os parâmetros da figura e o conteúdo dos valores
+# exibidos (que já dependem da versão dos dados)
+@st.cache_data(max_entries=256, show_spinner=False)
+def figura_em_cache(grafico: str, parametros: tuple, values, _montar):
+    def montar():
+        fig = _montar(values, *parametros)
+        if fig is None:
+            return None
+
+        # Tamanho de cada figura enviada ao navegador, registrado sempre que ela é montada
+        figura = fig.to_json()
+        print(f"Figura {grafico}: {len(figura.encode('utf-8'))} bytes, {len(fig.data)} traces")
+        return figura
+
+    return obter_em_disco(directory, ('figura', grafico, parametros, resumo_de(values)), montar)
+
+def figura_da_secao(grafico: str, values):
+    montar, parametros = FIGURAS[grafico]
+    return figura_em_cache(grafico, parametros, values, montar)
+
+def exibir_figura(grafico: str, values):
+    figura = figura_da_secao(grafico, values)
+
+    if figura is None:
+        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
+    else:
+        st.plotly_chart(pio.from_json(figura), use_container_width=True)
 
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("Outros", other_values))
+def figura_treemap(values_by_category, font_size):
+    if not values_by_category:
+        return None
 
-    category_labels = [format_legend_label(category[0]) for category in top_categories]
-    category_values = [category[1] for category in top_categories]
+    category_labels = [format_legend_label(category) for category in values_by_category]
+    category_values = list(values_by_category.values())
 
     category_labels = [f'{label}<br>{formatar_moeda(value)}<br>({(value/sum(category_values)*100):.1f}%)' for label, value in zip(category_labels, category_values)]
 
     df = pd.DataFrame(list(zip(category_labels, category_values)), columns =['category_labels', 'category_values'])
 
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-        fig = px.treemap(df, path=['category_labels'], values='category_values', color_discrete_sequence=custom_colors)
-        fig.update_layout(font=dict(size=18))
-        
-        st.plotly_chart(fig, use_container_width=True)
-
-def receita_12meses(user_year: int):
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.RECEITA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Arrecadação de receita' == movimento['tipoMovimento']):
-                        date = movimento['dataMovimento']
-                        year, month, _ = map(int, date.split('-'))
-                        
-                        if year == user_year:
-                            value = movimento['valorMovimento']
-                            category = registro['registro']['naturezaReceita']['especie']['denominacao']
-
-                            if category not in categories:
-                                categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = 0
-    
-                            values_by_category[month][category] += value
+    fig = px.treemap(df, path=['category_labels'], values='category_values', color_discrete_sequence=custom_colors)
+    fig.update_layout(font=dict(size=font_size))
+    return fig
+
+def tabela_12meses(values_by_month):
     data = []
-    for month, category_values in values_by_category.items():
-        for category, value in category_values.items():
+    for month, values_by_category in values_by_month.items():
+        for category, value in values_by_category.items():
             data.append({
                 'Mês': month,
                 'Categoria': category,
@@ -148,77 +190,118 @@ def receita_12meses(user_year: int):
             })
 
     df = pd.DataFrame(data)
-    df = df.sort_values(by='Valor', ascending=False)
+    return df.sort_values(by='Valor', ascending=False)
 
-    fig = px.bar(df, x='Mês', y='Valor', color='Categoria',
-                labels={'Valor': 'Valor', 'Categoria': 'Espécie'})
+# As barras são reduzidas antes de ir para o navegador: só as `top` categorias de maior total
+# no ano ficam separadas (as outras são somadas em "Outros" em cada mês), os valores são
+# arredondados em centavos e cada categoria vira um único trace enxuto, só com os campos que
+# diferem do padrão do Plotly (meses em int8 e valores em float64, codificados em binário)
+def figura_12meses(values_by_month, rotulo_categoria, arrowhead, arrowwidth, top):
+    df = tabela_12meses(values_by_month)
+    barras = tabela_12meses(arredondar_valores(manter_maiores_no_total(values_by_month, top)))
 
-    fig.update_yaxes(title_text='Valor (R$)')
-    fig.update_traces(hovertemplate='R$ %{y:,.2f}')
-    total_por_categoria = df['Valor'].sum()
+    fig = go.Figure([go.Bar(x=linhas['Mês'].to_numpy(dtype='int8'), y=linhas['Valor'].to_numpy(), name=category,
+                            hovertemplate='R$ %{y:,.2f}')
+                     for category, linhas in barras.groupby('Categoria', sort=False)])
 
-    fig.update_layout(yaxis_tickformat='$,.2f')
+    fig.update_layout(barmode='relative', legend_title_text=rotulo_categoria, xaxis_title='Mês',
+                      yaxis_title='Valor (R$)', yaxis_tickformat='$,.2f', margin=dict(t=60))
 
-    # Adiciona o valor total acima de cada barra
+    # Adiciona o valor total acima de cada barra (com todas as categorias, antes da redução)
     for month_num in range(1, 13):
         total_por_mes = df[df['Mês'] == month_num]['Valor'].sum()
         fig.add_annotation(
             x=month_num,
-            y=total_por_mes,
+            y=round(total_por_mes, 2),
             text=f'          {locale.currency(total_por_mes, grouping=True)}',
-            arrowhead=0,
+            arrowhead=arrowhead,
             arrowcolor="black",
-            arrowwidth=1,
+            arrowwidth=arrowwidth,
             arrowsize=1,
             font=dict(size=9),
             yshift=5
         )
+    return fig
 
-    st.plotly_chart(fig, use_container_width=True)
-    st.markdown(f'<h4 style=\'text-align: center;\'>Total de receitas no ano: {locale.currency(total_por_categoria, grouping=True)}</h4>', unsafe_allow_html=True) 
+def exibir_12meses(grafico, values_by_month, titulo_total):
+    exibir_figura(grafico, values_by_month)
 
-def dados_estatisticos_mes(user_year: int, user_month: int, categoria_despesa: str):
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
+    total_por_categoria = tabela_12meses(values_by_month)['Valor'].sum()
+    st.markdown(f'<h4 style=\'text-align: center;\'>{titulo_total}: {locale.currency(total_por_categoria, grouping=True)}</h4>', unsafe_allow_html=True) 
 
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
+def figura_barras(values_by_category, title):
+    if not values_by_category:
+        return None
 
-    top_expenses = []
+    category_labels = list(values_by_category)
+    category_values = list(values_by_category.values())
 
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for empenho_item in registro['registro']['listEmpenhoItens']:
-                    emissao = registro['registro']['empenho']['emissao']
-                    year, month, _ = map(int, emissao.split('-'))
+    fig = px.bar(
+        x=category_labels,
+        y=category_values,
+        title=title,
+        labels={'y': 'Valor', 'x': 'Categoria'},
+        text=category_values,
+    )
 
-                    category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
+    fig.update_traces(texttemplate='R$ %{text:,.2f}', textposition='outside', hovertemplate='R$ %{y:,.2f}', marker_color=custom_colors)
 
-                    if (year == user_year and (month == user_month or user_month == 0) and (categoria_despesa == category or categoria_despesa == "Todos")):
-                        value = empenho_item['quantidade'] * empenho_item['valorUnitario']
+    fig.update_layout(yaxis_tickformat="$,.2f")
+    return fig
 
-                        if value != 0:
-                            if category not in categories:
-                                categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = []
+def figura_categorias_economicas_receita(values_by_category):
+    df = pd.DataFrame(list(values_by_category.items()), columns=['Categoria', 'Valor'])
+    df['Valor Formatado'] = df['Valor'].apply(formatar_moeda)
+    fig = px.bar(df, x='Valor', y='Categoria', orientation='h', text='Valor Formatado')
+    fig.update_traces(marker_color=custom_colors)
+    return fig
 
-                            values_by_category[month][category].append(value)
+def categorias_economicas_receita(values_by_category):
+    exibir_figura('categorias_economicas_receita', values_by_category)
+
+def receitas_por_especie(values_by_category):
+    exibir_figura('receitas_por_especie', values_by_category)
+
+def receita_12meses(values_by_month):
+    exibir_12meses('receita_12meses', values_by_month, 'Total de receitas no ano')
+
+# Número de linhas que podem ser pedidas para a tabela de maiores despesas
+NUMEROS_RESULTADOS = [10, 50, 100]
+
+# Um resumo parcial (estatísticas e maiores itens) por (ano, mês, elemento), calculado em uma
+# única passada pelos itens do ano; os recortes da seção 6 juntam os parciais que selecionam
+def resumir_itens_empenho_em_cache(user_year: int, versao: tuple):
+    def resumir_itens():
+        _, itens = carregar_dados_em_cache(TiposDeDados.DESPESA.value, user_year, versao)
+
+        return resumir(itens, 'valorTotal', ('ano', 'mes', 'naturezaDespesa.elemento'), max(NUMEROS_RESULTADOS),
+                       ano=user_year, valorTotal=lambda value: value != 0)
+
+    return armazem.obter(('resumos', user_year), versao, resumir_itens)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def resumo_itens_empenho_em_cache(user_year: int, user_month: int, categoria_despesa: str, versao: tuple):
+    def resumir_recorte():
+        _, itens = carregar_dados_em_cache(TiposDeDados.DESPESA.value, user_year, versao)
+        parciais = resumir_itens_empenho_em_cache(user_year, versao)
+
+        resumo = juntar_resumos((parcial for (_, month, category), parcial in parciais.items()
+                                 if (month == user_month or user_month == 0) and (categoria_despesa == category or categoria_despesa == "Todos")),
+                                max(NUMEROS_RESULTADOS))
+
+        return resumo.estatisticas.resultado(), itens.selecionar(resumo.indices_maiores())
+
+    return obter_em_disco(directory, ('resumo_itens', user_year, user_month, categoria_despesa, versao), resumir_recorte)
+
+def resumo_itens_empenho(user_year: int, user_month: int, categoria_despesa: str):
+    return resumo_itens_empenho_em_cache(user_year, user_month, categoria_despesa, versao_dados(TiposDeDados.DESPESA, user_year))
+
+def dados_estatisticos_mes(user_year: int, user_month: int, categoria_despesa: str):
+    estatisticas, _ = resumo_itens_empenho(user_year, user_month, categoria_despesa)
+
+    if estatisticas.quantidade:
+        media, mediana, desvio_padrao = estatisticas.media, estatisticas.mediana, estatisticas.desvio_padrao
 
-                            top_expenses.append({
-                                'Valor total': value
-                            })
-    
-    # Calcular e exibir estatísticas
-    valores_totais = pd.DataFrame(top_expenses)
-
-    if 'Valor total' in valores_totais.columns:
-        valores_totais = valores_totais.get('Valor total', 0).apply(lambda x: float(x))
-        media = valores_totais.mean()
-        mediana = valores_totais.median()
-        desvio_padrao = valores_totais.std()
-            
         print("Estatísticas:")
         print(f"Média: {formatar_moeda(media)}")
         print(f"Mediana: {formatar_moeda(mediana)}")
@@ -226,52 +309,11 @@ def dados_estatisticos_mes(user_year: int, user_month: int, categoria_despesa: s
         print(f'Coeficiente de Variação: {(desvio_padrao / media) * 100:.2f}%') 
 
 def maiores_despesas_ano(user_year: int, user_month: int, categoria_despesa: str, numero_resultados: int):
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    top_expenses = []
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for empenho_item in registro['registro']['listEmpenhoItens']:
-                    emissao = registro['registro']['empenho']['emissao']
-                    year, month, _ = map(int, emissao.split('-'))
-
-                    category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                    if (year == user_year and (month == user_month or user_month == 0) and (categoria_despesa == category or categoria_despesa == "Todos")):
-                        value = empenho_item['quantidade'] * empenho_item['valorUnitario']
-
-                        if value != 0:
-                            if category not in categories:
-                                categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = []
-
-                            values_by_category[month][category].append(value)
-
-                            top_expenses.append({
-                                'Categoria': category,
-                                'Denominação do Empenho': empenho_item['denominacao'],
-                                'Emissão': datetime.strptime(emissao, "%Y-%m-%d").strftime("%d/%m/%Y"),
-                                'Quantidade': empenho_item['quantidade'],
-                                'Unidade de Medida': empenho_item['unidadeMedida']['sigla'],
-                                'Valor unitário': empenho_item['valorUnitario'],
-                                'Valor total': value
-                            })
-    
-    # Calcular e exibir estatísticas
-    valores_totais = pd.DataFrame(top_expenses)
+    estatisticas, maiores = resumo_itens_empenho(user_year, user_month, categoria_despesa)
 
-    if 'Valor total' in valores_totais.columns:
-        valores_totais = valores_totais.get('Valor total', 0).apply(lambda x: float(x))
-        media = valores_totais.mean()
-        mediana = valores_totais.median()
-        desvio_padrao = valores_totais.std()
+    # Exibir estatísticas
+    if estatisticas.quantidade:
+        media, mediana, desvio_padrao = estatisticas.media, estatisticas.mediana, estatisticas.desvio_padrao
 
         row1, row2, row3, row4 = st.columns((1, 1, 1, 1))
         with row1:
@@ -288,396 +330,163 @@ def maiores_despesas_ano(user_year: int, user_month: int, categoria_despesa: str
             coeficiente_variacao = (desvio_padrao / media) * 100
             st.markdown(f'<center>{coeficiente_variacao:.2f}%</center>', unsafe_allow_html=True)        
 
-    if top_expenses:
-        top_expenses_df = pd.DataFrame(top_expenses)
-        top_expenses_df = top_expenses_df.sort_values(by='Valor total', ascending=False).head(numero_resultados)
+    # Só as linhas exibidas são formatadas
+    maiores = maiores.selecionar(range(min(numero_resultados, len(maiores))))
 
-        formatted_df = top_expenses_df.copy()
-        formatted_df['Valor total'] = formatted_df['Valor total'].apply(formatar_moeda)
-        formatted_df['Valor unitário'] = formatted_df['Valor unitário'].apply(formatar_moeda)
-        formatted_df['Quantidade'] = formatted_df['Quantidade'].apply(lambda x: f'{x:.2f}')
+    if len(maiores):
+        top_expenses = []
 
-        st.table(formatted_df)
-    else:
-        st.warning("Não há despesas para o período especificado.")
-
-def load_despesa_categories(user_year: int):
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for empenho_item in registro['registro']['listEmpenhoItens']:
-                    emissao = registro['registro']['empenho']['emissao']
-                    year, month, _ = map(int, emissao.split('-'))
-
-                    category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                    if year == user_year:
-                        value = empenho_item['quantidade'] * empenho_item['valorUnitario']
-
-                        if value != 0:
-                            if category not in categories:
-                                categories.add(category)
-                                despesa_categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = []
-
-                            values_by_category[month][category].append(value)
-
-def despesa_12meses(user_year: int):
-    categories = set()
-    values_by_category = {month: {} for month in range(1, 13)}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Pagamento de empenho' == movimento['tipoMovimento'] or 'Pagamento de restos a pagar' == movimento['tipoMovimento']):
-                        date = movimento['dataMovimento']
-                        year, month, _ = map(int, date.split('-'))
-                        
-                        if year == user_year:
-                            value = movimento['valorMovimento']
-                            category = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                            if category not in categories:
-                                categories.add(category)
-                                for month_num in range(1, 13):
-                                    values_by_category[month_num][category] = 0
-    
-                            values_by_category[month][category] += value
-    data = []
-    for month, category_values in values_by_category.items():
-        for category, value in category_values.items():
-            data.append({
-                'Mês': month,
+        for category, denominacao, emissao, quantidade, sigla, valor_unitario, value in maiores.linhas(
+                'naturezaDespesa.elemento', 'denominacao', 'emissao', 'quantidade', 'unidadeMedida', 'valorUnitario', 'valorTotal'):
+            top_expenses.append({
                 'Categoria': category,
-                'Valor': value
+                'Denominação do Empenho': denominacao,
+                'Emissão': datetime.strptime(emissao, "%Y-%m-%d").strftime("%d/%m/%Y"),
+                'Quantidade': f'{quantidade:.2f}',
+                'Unidade de Medida': sigla,
+                'Valor unitário': formatar_moeda(valor_unitario),
+                'Valor total': formatar_moeda(value)
             })
 
-    df = pd.DataFrame(data)
-    df = df.sort_values(by='Valor', ascending=False)
-
-    fig = px.bar(df, x='Mês', y='Valor', color='Categoria',
-                labels={'Valor': 'Valor', 'Categoria': 'Elemento de despesa'})
-
-    fig.update_yaxes(title_text='Valor (R$)')
-    fig.update_traces(hovertemplate='R$ %{y:,.2f}')
-    total_por_categoria = df['Valor'].sum()
-
-    fig.update_layout(yaxis_tickformat='$,.2f')
-
-    # Adiciona o valor total acima de cada barra
-    for month_num in range(1, 13):
-        total_por_mes = df[df['Mês'] == month_num]['Valor'].sum()
-        fig.add_annotation(
-            x=month_num,
-            y=total_por_mes,
-            text=f'          {locale.currency(total_por_mes, grouping=True)}',
-            arrowhead=2,
-            arrowcolor="black",
-            arrowwidth=2,
-            arrowsize=1,
-            font=dict(size=9),
-            yshift=5
-        )
-    fig.update_layout(yaxis_tickformat='$,.2f')
-    st.plotly_chart(fig, use_container_width=True)
-    st.markdown(f'<h4 style=\'text-align: center;\'>Total de despesas pagas no ano: {locale.currency(total_por_categoria, grouping=True)}</h4>', unsafe_allow_html=True) 
-
-
-def despesas_por_elemento(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith(f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Pagamento de empenho' == movimento['tipoMovimento'] or 'Pagamento de restos a pagar' == movimento['tipoMovimento']):
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['naturezaDespesa']['elemento']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    top_categories = sorted_categories[:10]
-    other_categories = sorted_categories[10:]
-
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("Outros", other_values))
-
-    category_labels = [format_legend_label(category[0]) for category in top_categories]
-    category_values = [category[1] for category in top_categories]
-
-    category_labels = [f'{label}<br>{formatar_moeda(value)}<br>({(value/sum(category_values)*100):.1f}%)' for label, value in zip(category_labels, category_values)]
-
-    df = pd.DataFrame(list(zip(category_labels, category_values)), columns =['category_labels', 'category_values'])
-
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-        fig = px.treemap(df, path=['category_labels'], values='category_values', color_discrete_sequence=custom_colors)
-        fig.update_layout(font=dict(size=17))
-        
-        st.plotly_chart(fig, use_container_width=True)
-
-def despesas_por_secretaria(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Pagamento de empenho' == movimento['tipoMovimento'] or 'Pagamento de restos a pagar' == movimento['tipoMovimento']):
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['unidadeOrcamentaria']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    top_categories = sorted_categories[:5]
-    other_categories = sorted_categories[5:]
-
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("Outros", other_values))
-
-    category_labels = [format_legend_label(category[0]) for category in top_categories]
-    category_values = [category[1] for category in top_categories]
-
-    category_labels = [f'{label}<br>{formatar_moeda(value)}<br>({(value/sum(category_values)*100):.1f}%)' for label, value in zip(category_labels, category_values)]
-
-    df = pd.DataFrame(list(zip(category_labels, category_values)), columns =['category_labels', 'category_values'])
-
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-        fig = px.treemap(df, path=['category_labels'], values='category_values', color_discrete_sequence=custom_colors)
-        fig.update_layout(font=dict(size=17))
-        
-        st.plotly_chart(fig, use_container_width=True)
-
-def despesas_por_area(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Pagamento de empenho' == movimento['tipoMovimento'] or 'Pagamento de restos a pagar' == movimento['tipoMovimento']):
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['despesa']['funcao']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    top_categories = sorted_categories[:5]
-    other_categories = sorted_categories[5:]
-
-    other_values = sum(category[1] for category in other_categories)
-    top_categories.append(("Outros", other_values))
-
-    category_labels = [format_legend_label(category[0]) for category in top_categories]
-    category_values = [category[1] for category in top_categories]
-
-    category_labels = [f'{label}<br>{formatar_moeda(value)}<br>({(value/sum(category_values)*100):.1f}%)' for label, value in zip(category_labels, category_values)]
-
-    df = pd.DataFrame(list(zip(category_labels, category_values)), columns =['category_labels', 'category_values'])
-
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-        fig = px.treemap(df, path=['category_labels'], values='category_values', color_discrete_sequence=custom_colors)
-        fig.update_layout(font=dict(size=17))
-        
-        st.plotly_chart(fig, use_container_width=True)
-
-
-def categorias_economicas(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if ('Pagamento de empenho' == movimento['tipoMovimento'] or 'Pagamento de restos a pagar' == movimento['tipoMovimento']):
-                        date = movimento['dataMovimento']
-                        value = movimento['valorMovimento']
-
-                        tipo_movimento = registro['registro']['naturezaDespesa']['categoriaEconomica']['denominacao']
-
-                        if tipo_movimento not in categories:
-                            categories.add(tipo_movimento)
-                            values_by_category[tipo_movimento] = value
-                        else:
-                            values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    category_labels = [category[0] for category in sorted_categories]
-    category_values = [category[1] for category in sorted_categories]
-
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-        fig = px.pie(
-            names=category_labels,
-            values=category_values,
-            labels={'value': 'Valor'},
-            title=f'Pagamento de despesas por categoria econômica',
-            color_discrete_sequence=custom_colors,
-            hole=0.4,
-        )
-        fig.update_traces(hovertemplate='R$ %{value:,.2f}')
-        st.plotly_chart(fig, use_container_width=True)
-
-def execucao_restos_a_pagar(user_year):
-    categories = set()
-    values_by_category = {}
-
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
-
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if (movimento['tipoMovimento'] == 'Pagamento de restos a pagar' 
-                        or 'Cancelamento de restos a pagar' in movimento['tipoMovimento']):
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-                        
-                        if year == user_year or user_year == 0:
-                            value = movimento['valorMovimento']
-
-                            if movimento['tipoMovimento'] == 'Pagamento de restos a pagar':
-                                tipo_movimento = 'Valor pago'                             
-                            elif 'Cancelamento de restos a pagar' in movimento['tipoMovimento']:
-                                tipo_movimento = 'Valor cancelado'
-
-                            if tipo_movimento not in categories:
-                               categories.add(tipo_movimento)
-                               values_by_category[tipo_movimento] = value
-                            else:
-                                values_by_category[tipo_movimento] += value
-
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
-
-    category_labels = [category[0] for category in sorted_categories]
-    category_values = [category[1] for category in sorted_categories]
-
-    if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
+        st.table(pd.DataFrame(top_expenses))
     else:
-        fig = px.bar(
-            x=category_labels,
-            y=category_values,
-            title=f'Execução dos compromissos de anos anteriores (restos a pagar)',
-            labels={'y': 'Valor', 'x': 'Categoria'},
-            text=category_values,
-        )
+        st.warning("Não há despesas para o período especificado.")
 
-        fig.update_traces(texttemplate='R$ %{text:,.2f}', textposition='outside', hovertemplate='R$ %{y:,.2f}', marker_color=custom_colors)
+# As categorias são as do ano escolhido nesta sessão (nada fica guardado entre sessões)
+@st.cache_data(max_entries=64, show_spinner=False)
+def despesa_categories_em_cache(user_year: int, versao: tuple):
+    def categorias():
+        parciais = resumir_itens_empenho_em_cache(user_year, versao)
+        return list(dict.fromkeys(category for _, _, category in parciais))
 
-        fig.update_layout(yaxis_tickformat="$,.2f")
+    return obter_em_disco(directory, ('categorias', user_year, versao), categorias)
 
-        st.plotly_chart(fig, use_container_width=True)
+def despesa_categories(user_year: int):
+    return despesa_categories_em_cache(user_year, versao_dados(TiposDeDados.DESPESA, user_year))
 
-def execucao_despesas(user_year):
-    categories = set()
-    values_by_category = {}
+# A seção 6 é um fragmento: mudar a categoria, o mês ou o número de resultados reexecuta só
+# esta função, sem recalcular as seções de cima
+@st.fragment
+def secao_maiores_despesas(ano_exercicio: int):
+    st.markdown("<h2 style='text-align: center;'>Maiores despesas empenhadas</h2>", unsafe_allow_html=True) 
+    
+    row6_1, row6_2, row6_3 = st.columns((1, 1, 1))
+    with row6_1:
+        categoria_despesa = st.selectbox("Qual categoria de despesa?", ["Todos"] + despesa_categories(ano_exercicio), key = 'seletor_boxplot')        
+    with row6_2:
+        mes = st.selectbox("Qual o mês?", ['Todos', 12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1], key = 'month')           
+    with row6_3:
+        tamanho_resultados = st.selectbox("Número de resultados", NUMEROS_RESULTADOS, key = 'results')        
 
-    json_files = [filename for filename in os.listdir(directory) if filename.endswith('.json' if user_year == 0 else f'{user_year}.json') and TiposDeDados.DESPESA.value in filename.lower()]
+    maiores_despesas_ano(ano_exercicio, 0 if mes == 'Todos' else mes, categoria_despesa, tamanho_resultados)
 
-    for json_file in json_files:
-        with open(os.path.join(directory, json_file), 'r') as file:
-            data = json.load(file)
-            for registro in data['registros']:
-                for movimento in registro['registro']['listMovimentos']:
-                    if (movimento['tipoMovimento'] == 'Emissão de empenho' 
-                        or movimento['tipoMovimento'] == 'Liquidação de empenho'
-                        or movimento['tipoMovimento'] == 'Pagamento de empenho'):
-                        date = movimento['dataMovimento']
-                        year = int(date.split('-')[0])
-                        
-                        if year == user_year or user_year == 0:
-                            value = movimento['valorMovimento']
+    dados_estatisticos_mes(ano_exercicio, 0 if mes == 'Todos' else mes, categoria_despesa)
 
-                            if movimento['tipoMovimento'] == 'Emissão de empenho':
-                                tipo_movimento = 'Empenhado'                             
-                            elif movimento['tipoMovimento'] == 'Liquidação de empenho':
-                                tipo_movimento = 'Liquidado'                             
-                            elif movimento['tipoMovimento'] == 'Pagamento de empenho':
-                                tipo_movimento = 'Pago' 
+def despesa_12meses(values_by_month):
+    exibir_12meses('despesa_12meses', values_by_month, 'Total de despesas pagas no ano')
 
-                            if tipo_movimento not in categories:
-                               categories.add(tipo_movimento)
-                               values_by_category[tipo_movimento] = value
-                            else:
-                                values_by_category[tipo_movimento] += value
+def despesas_por_elemento(values_by_category):
+    exibir_figura('despesas_por_elemento', values_by_category)
 
-    sorted_categories = sorted(values_by_category.items(), key=lambda x: x[1], reverse=True)
+def despesas_por_secretaria(values_by_category):
+    exibir_figura('despesas_por_secretaria', values_by_category)
 
-    category_labels = [category[0] for category in sorted_categories]
-    category_values = [category[1] for category in sorted_categories]
+def despesas_por_area(values_by_category):
+    exibir_figura('despesas_por_area', values_by_category)
 
+def figura_categorias_economicas(values_by_category):
     if not values_by_category:
-        st.warning("Não há valores em nenhuma das categorias para o ano especificado.")
-    else:
-
-        fig = px.bar(
-            x=category_labels,
-            y=category_values,
-            title=f'Execução das despesas',
-            labels={'y': 'Valor', 'x': 'Categoria'},
-            text=category_values,
-        )
-
-        fig.update_traces(texttemplate='R$ %{text:,.2f}', hovertemplate='R$ %{y:,.2f}', textposition='outside')
-        fig.update_traces(marker_color=custom_colors)
-        fig.update_layout(yaxis_tickformat="$,.2f")
-        st.plotly_chart(fig, use_container_width=True)
+        return None
+
+    fig = px.pie(
+        names=list(values_by_category),
+        values=list(values_by_category.values()),
+        labels={'value': 'Valor'},
+        title=f'Pagamento de despesas por categoria econômica',
+        color_discrete_sequence=custom_colors,
+        hole=0.4,
+    )
+    fig.update_traces(hovertemplate='R$ %{value:,.2f}')
+    return fig
+
+def categorias_economicas(values_by_category):
+    exibir_figura('categorias_economicas', values_by_category)
+
+def execucao_restos_a_pagar(values_by_category):
+    exibir_figura('execucao_restos_a_pagar', values_by_category)
+
+def execucao_despesas(values_by_category):
+    exibir_figura('execucao_despesas', values_by_category)
+
+# Número de categorias exibidas separadamente nos gráficos de 12 meses (None exibe todas)
+TOP_CATEGORIAS_12MESES = 10
+
+# Figura de cada seção: a função que a monta e os parâmetros passados depois dos valores
+FIGURAS = {
+    'execucao_despesas': (figura_barras, ('Execução das despesas',)),
+    'categorias_economicas': (figura_categorias_economicas, ()),
+    'execucao_restos_a_pagar': (figura_barras, ('Execução dos compromissos de anos anteriores (restos a pagar)',)),
+    'despesa_12meses': (figura_12meses, ('Elemento de despesa', 2, 2, TOP_CATEGORIAS_12MESES)),
+    'despesas_por_area': (figura_treemap, (17,)),
+    'despesas_por_elemento': (figura_treemap, (17,)),
+    'despesas_por_secretaria': (figura_treemap, (17,)),
+    'receita_12meses': (figura_12meses, ('Espécie', 0, 1, TOP_CATEGORIAS_12MESES)),
+    'receitas_por_especie': (figura_treemap, (18,)),
+    'categorias_economicas_receita': (figura_categorias_economicas_receita, ()),
+}
+
+# Anos que podem ser escolhidos na barra lateral
+ANOS_EXERCICIO = [2023, 2022, 2021]
+
+def aquecer_combinacao(tipo_de_dados: TiposDeDados, user_year: int):
+    # Os mesmos caches usados pela página: o cubo e os itens no armazém, e as agregações, as
+    # figuras e a seção 6 com os filtros iniciais (todas as categorias e meses) no cache do
+    # Streamlit e no cache em disco
+    for grafico, values in agregar_pagina(tipo_de_dados, user_year).items():
+        figura_da_secao(grafico, values)
+    if tipo_de_dados == TiposDeDados.DESPESA:
+        despesa_categories(user_year)
+        resumo_itens_empenho(user_year, 0, "Todos")
+
+# Aquecimento dos caches ao iniciar o processo: todas as combinações de tipo e ano da barra
+# lateral são calculadas em segundo plano, começando pela página inicial. Uma sessão que pede
+# uma combinação em cálculo espera por ele (as travas do armazém e do cache) em vez de repeti-lo
+class Aquecimento:
+    def __init__(self):
+        self.combinacoes = [(tipo_de_dados, ano) for tipo_de_dados in TiposDeDados for ano in ANOS_EXERCICIO]
+        self.concluidas = 0
+        self.erros = []
+
+    def pronto(self):
+        return self.concluidas == len(self.combinacoes)
+
+    def executar(self):
+        inicio = time.perf_counter()
+        for tipo_de_dados, ano in self.combinacoes:
+            try:
+                aquecer_combinacao(tipo_de_dados, ano)
+            except Exception as e:
+                # A combinação fica fria e é calculada (e o erro exibido) quando for pedida
+                self.erros.append((tipo_de_dados.name, ano, e))
+                print(f"Erro ao preparar {tipo_de_dados.name} {ano}: {e}")
+            self.concluidas += 1
+            print(f"Dados preparados: {tipo_de_dados.name} {ano} ({self.concluidas} de {len(self.combinacoes)})")
+        print(f"Aquecimento concluído em {time.perf_counter() - inicio:.1f} s")
+
+# Um único aquecimento por processo, compartilhado por todas as sessões
+@st.cache_resource(show_spinner=False)
+def iniciar_aquecimento():
+    aquecimento = Aquecimento()
+    # A thread não recebe o contexto de nenhuma sessão: ela é compartilhada pelo processo inteiro e
+    # dura mais que a sessão que a iniciou, e os caches do Streamlit funcionam sem contexto
+    thread = threading.Thread(target=aquecimento.executar, name='aquecimento', daemon=True)
+    thread.start()
+    return aquecimento
+
+def exibir_aquecimento(aquecimento: Aquecimento):
+    if not aquecimento.pronto():
+        st.sidebar.progress(aquecimento.concluidas / len(aquecimento.combinacoes),
+                            text=f"Preparando os dados: {aquecimento.concluidas} de {len(aquecimento.combinacoes)} combinações")
 
 if __name__ == "__main__":
     locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
@@ -702,9 +511,11 @@ if __name__ == "__main__":
 
     tipo_de_dados = st.sidebar.selectbox("Qual o tipo de dados?", list(TiposDeDados.__members__.keys()), key = 'tipo_dados')
     
-    ano_exercicio = st.sidebar.selectbox("Qual ano você quer analisar?", [2023 ,2022, 2021], key = 'ano_exercicio')
+    ano_exercicio = st.sidebar.selectbox("Qual ano você quer analisar?", ANOS_EXERCICIO, key = 'ano_exercicio')
 
-    load_despesa_categories(ano_exercicio)
+    exibir_aquecimento(iniciar_aquecimento())
+
+    resultados = agregar_pagina(TiposDeDados[tipo_de_dados], ano_exercicio)
 
     if tipo_de_dados == "DESPESA":
                 
@@ -713,66 +524,54 @@ if __name__ == "__main__":
 
         row1_1_1, row1_2_1, row1_3_1 = st.columns((1, 1, 1))
         with row1_1_1:
-            execucao_despesas(ano_exercicio)   
+            execucao_despesas(resultados['execucao_despesas'])   
         with row1_2_1:
-            categorias_economicas(ano_exercicio)
+            categorias_economicas(resultados['categorias_economicas'])
         with row1_3_1:
-            execucao_restos_a_pagar(ano_exercicio)
+            execucao_restos_a_pagar(resultados['execucao_restos_a_pagar'])
 
         st.markdown("---")
 
         #SEC2
         st.markdown("<h2 style='text-align: center;'>Pagamento de despesas por mês do ano</h2>", unsafe_allow_html=True)
         st.markdown(f'<h6 style=\'text-align: center;\'>(Clique duas vezes em uma categoria para selecioná-la)</h6>', unsafe_allow_html=True)  
-        despesa_12meses(ano_exercicio)
+        despesa_12meses(resultados['despesa_12meses'])
 
         st.markdown("---")
 
         #SEC3
         st.markdown("<h2 style='text-align: center;'>Pagamento de despesas no ano por área de atuação (função)</h2>", unsafe_allow_html=True) 
 
-        despesas_por_area(ano_exercicio)
+        despesas_por_area(resultados['despesas_por_area'])
 
         st.markdown("---")
 
         #SEC4
         st.markdown("<h2 style='text-align: center;'>Pagamento de despesas no ano por elemento de despesa</h2>", unsafe_allow_html=True)
         
-        despesas_por_elemento(ano_exercicio) 
+        despesas_por_elemento(resultados['despesas_por_elemento']) 
 
         st.markdown("---")
 
         #SEC5
         st.markdown("<h2 style='text-align: center;'>Pagamento de despesas no ano por secretaria</h2>", unsafe_allow_html=True)
         
-        despesas_por_secretaria(ano_exercicio) 
+        despesas_por_secretaria(resultados['despesas_por_secretaria']) 
 
         st.markdown("---")
 
         #SEC6
-        st.markdown("<h2 style='text-align: center;'>Maiores despesas empenhadas</h2>", unsafe_allow_html=True) 
-        
-        row6_1, row6_2, row6_3 = st.columns((1, 1, 1))
-        with row6_1:
-            categoria_despesa = st.selectbox("Qual categoria de despesa?", ["Todos"] + list([categoria for categoria in despesa_categories]), key = 'seletor_boxplot')        
-        with row6_2:
-            mes = st.selectbox("Qual o mês?", ['Todos', 12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1], key = 'month')           
-        with row6_3:
-            tamanho_resultados = st.selectbox("Número de resultados", [10, 50, 100], key = 'results')        
-
-        maiores_despesas_ano(ano_exercicio, 0 if mes == 'Todos' else mes, categoria_despesa, tamanho_resultados)
-
-        dados_estatisticos_mes(ano_exercicio, 0 if mes == 'Todos' else mes, categoria_despesa)
+        secao_maiores_despesas(ano_exercicio)
 
     elif tipo_de_dados == "RECEITA":
 
         st.markdown("<h2 style='text-align: center;'>Arrecadação por mês do ano</h2>", unsafe_allow_html=True) 
-        receita_12meses(ano_exercicio) 
+        receita_12meses(resultados['receita_12meses']) 
 
         st.markdown("---")
         st.markdown("<h2 style='text-align: center;'>Arrecadação anual (por espécie)</h2>", unsafe_allow_html=True)
-        receitas_por_especie(ano_exercicio)
+        receitas_por_especie(resultados['receitas_por_especie'])
         st.markdown("---")
         st.markdown("<h2 style='text-align: center;'>Arrecadação anual (por categoria econômica)</h2>", unsafe_allow_html=True)
-        categorias_economicas_receita(ano_exercicio)
+        categorias_economicas_receita(resultados['categorias_economicas_receita'])
     
\ No newline at end of file